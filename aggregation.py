@@ -0,0 +1,742 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from data import get_dataset, get_derived, to_plot_values, weather_columns
+
+# width of the bins of the weather conditions, in °C and m/s
+temperature_bin_width = 2
+wind_speed_bin_width = 2
+# lower bounds of the trip duration bins in minutes, the last bin is open
+duration_bins = [0, 5, 10, 15, 20, 30, 45, 60]
+
+
+def _get_indexes(categories, values):
+    # None or empty selects all categories, unknown values are ignored
+    if values is None or len(values) == 0:
+        return np.arange(len(categories))
+    return np.array([categories.index(value) for value in values if value in categories], dtype=np.intp)
+
+
+class StationDimension:
+    """
+    Stations of a dataset keyed by their ID, built once when the dataset is loaded. Name and coordinates are taken
+    from the latest trip of the station, so a station whose coordinates drift stays one station. The position of a
+    station in stations is its code, trips are aggregated on these integer codes.
+    """
+
+    def __init__(self, data):
+        # only numeric arrays over all trips, the attributes are taken for the latest trip of each station only
+        prefixes = [prefix for prefix in ('Start', 'End') if '{} Station ID'.format(prefix) in data.columns]
+        times = data['Start Time'].values.view(np.int64)
+        df = pd.DataFrame({
+            'Station ID': np.concatenate([data['{} Station ID'.format(prefix)].to_numpy(dtype=np.float64,
+                                                                                      na_value=np.nan)
+                                          for prefix in prefixes]),
+            'Time': np.tile(times, len(prefixes)),
+            'Row': np.arange(len(data) * len(prefixes)),
+        }).dropna(subset=['Station ID'])
+
+        grouped = df.groupby('Station ID', sort=True)['Time']
+        latest_rows = df.loc[grouped.idxmax(), 'Row'].to_numpy()
+
+        attributes = []
+        for i, prefix in enumerate(prefixes):
+            rows = latest_rows[latest_rows // len(data) == i] % len(data)
+            attributes.append(pd.DataFrame({
+                'Station ID': data['{} Station ID'.format(prefix)].iloc[rows].to_numpy(dtype=np.int64),
+                'Name': data['{} Station Name'.format(prefix)].iloc[rows].astype(str).to_numpy(),
+                'Latitude': data['{} Station Latitude'.format(prefix)].iloc[rows].to_numpy(),
+                'Longitude': data['{} Station Longitude'.format(prefix)].iloc[rows].to_numpy(),
+            }))
+        df_stations = pd.concat(attributes, ignore_index=True).sort_values('Station ID').reset_index(drop=True)
+
+        timezone = data['Start Time'].dt.tz
+        self.stations = df_stations.assign(**{
+            'Latitude': to_plot_values(df_stations['Latitude']),
+            'Longitude': to_plot_values(df_stations['Longitude']),
+            'First Seen': pd.to_datetime(grouped.min().to_numpy(), utc=True).tz_convert(timezone),
+            'Last Seen': pd.to_datetime(grouped.max().to_numpy(), utc=True).tz_convert(timezone),
+        })
+        self.ids = self.stations['Station ID'].to_numpy()
+
+    def get_codes(self, station_ids):
+        """
+        :param station_ids: Station IDs, e.g. the column Start Station ID.
+        :return: The code of each station, -1 for missing or unknown IDs.
+        """
+        values = pd.Series(station_ids).to_numpy(dtype=np.float64, na_value=np.nan)
+        known = ~np.isnan(values)
+        positions = np.searchsorted(self.ids, values[known]).clip(max=max(len(self.ids) - 1, 0))
+        codes = np.full(len(values), -1, dtype=np.intp)
+        codes[known] = np.where(self.ids[positions] == values[known], positions, -1)
+        return codes
+
+    def get_attributes(self, codes):
+        """
+        :param codes: The codes of the stations to plot.
+        :return: Station ID, Name, Latitude and Longitude of the stations, in the order of the codes.
+        """
+        return self.stations.iloc[codes][['Station ID', 'Name', 'Latitude', 'Longitude']].reset_index(drop=True)
+
+
+def encode_stations(data, dimension, column):
+    """
+    :param data: The trips.
+    :param dimension: The station dimension of the trips.
+    :param column: The station ID column, Start Station ID or End Station ID.
+    :return: The station code of each trip as compact read-only integer array, -1 for unknown stations.
+    """
+    codes = dimension.get_codes(data[column])
+    codes = codes.astype(np.int16 if len(dimension.ids) < np.iinfo(np.int16).max else np.int32)
+    codes.flags.writeable = False
+    return codes
+
+
+def count_stations(codes, size, mask=None):
+    """
+    Counts the trips per station in one pass over the integer station codes.
+    :param codes: The station code of each trip, -1 for unknown stations.
+    :param size: The number of stations.
+    :param mask: Boolean array selecting the trips to count, None counts all trips.
+    :return: The number of trips of each station (indexed by the station codes).
+    """
+    selected = codes if mask is None else codes[mask]
+    return np.bincount(selected[selected >= 0], minlength=size)
+
+
+def create_station_counts(dimension, counts):
+    """
+    Joins the attributes of the stations to the counts, only for the stations with at least one trip.
+    :param dimension: The station dimension of the counts.
+    :param counts: The number of trips of each station (indexed by the station codes).
+    :return: The columns Station ID, Name, Latitude, Longitude and Trip Count.
+    """
+    plotted = np.flatnonzero(counts)
+    return dimension.get_attributes(plotted).assign(**{'Trip Count': counts[plotted]})
+
+
+def get_degrees_per_pixel(zoom):
+    # width of the world in mapbox is 512 pixels at zoom level 0
+    return 360 / (512 * 2 ** zoom)
+
+
+def bin_station_counts(data, zoom, cell_pixels=40):
+    """
+    Combines the stations within a grid cell of cell_pixels at the zoom level to one marker, so the number of markers
+    is bounded by the size of the map instead of the number of stations.
+    :param data: The station counts, see create_station_counts.
+    :param zoom: The zoom level of the map.
+    :param cell_pixels: The size of a grid cell in pixels.
+    :return: One row per cell with the columns Station ID (NaN for more than one station), Name (name of the station or
+    number of stations), Latitude and Longitude (weighted by the trips), Trip Count and Station Count.
+    """
+    if len(data) == 0:
+        return data.assign(**{'Station Count': data['Trip Count']})
+    cell_lon = cell_pixels * get_degrees_per_pixel(zoom)
+    cell_lat = cell_lon * np.cos(np.radians(data['Latitude'].mean()))
+    weights = data['Trip Count'].to_numpy(dtype=np.float64)
+    grouped = pd.DataFrame({
+        'Weighted Latitude': data['Latitude'].to_numpy() * weights,
+        'Weighted Longitude': data['Longitude'].to_numpy() * weights,
+        'Trip Count': data['Trip Count'].to_numpy(),
+        'Station Count': np.ones(len(data), dtype=np.int64),
+        'Station ID': data['Station ID'].to_numpy(dtype=np.float64),
+        'Name': data['Name'].to_numpy(),
+    }).groupby([np.floor(data['Latitude'].to_numpy() / cell_lat), np.floor(data['Longitude'].to_numpy() / cell_lon)])
+
+    df_cells = grouped.agg({
+        'Weighted Latitude': 'sum',
+        'Weighted Longitude': 'sum',
+        'Trip Count': 'sum',
+        'Station Count': 'sum',
+        'Station ID': 'first',
+        'Name': 'first',
+    }).reset_index(drop=True)
+    return pd.DataFrame({
+        'Station ID': df_cells['Station ID'].where(df_cells['Station Count'] == 1),
+        'Name': df_cells['Name'].where(df_cells['Station Count'] == 1,
+                                       df_cells['Station Count'].map('{:,d} Stationen'.format)),
+        'Latitude': (df_cells['Weighted Latitude'] / df_cells['Trip Count']).round(6),
+        'Longitude': (df_cells['Weighted Longitude'] / df_cells['Trip Count']).round(6),
+        'Trip Count': df_cells['Trip Count'],
+        'Station Count': df_cells['Station Count'],
+    })
+
+
+def select_bounds(data, bounds):
+    """
+    :param data: The station counts, see create_station_counts.
+    :param bounds: (south, north, west, east) in degrees.
+    :return: The stations within the bounds.
+    """
+    south, north, west, east = bounds
+    inside = data['Latitude'].between(south, north) & data['Longitude'].between(west, east)
+    return data[inside].reset_index(drop=True)
+
+
+class StationCube:
+    """
+    Number of trips per start station, user type and gender, counted once when the dataset is loaded. Any filter
+    combination of the pages "Nutzung Stationen" is answered by summing a slice of the cube.
+    """
+
+    def __init__(self, data, dimension, station_codes):
+        self.dimension = dimension
+
+        user_types = pd.Categorical(data['User Type'])
+        genders = pd.Categorical(data['Gender'])
+        self.user_types = list(user_types.categories)
+        self.genders = list(genders.categories)
+
+        shape = (len(dimension.ids), len(self.user_types), len(self.genders))
+        valid = (station_codes >= 0) & (user_types.codes >= 0) & (genders.codes >= 0)
+        cell_codes = np.ravel_multi_index(
+            (station_codes[valid], user_types.codes[valid], genders.codes[valid]),
+            shape
+        )
+        self.counts = np.bincount(cell_codes, minlength=int(np.prod(shape))).reshape(shape)
+
+        # cell of each trip, -1 for trips not counted, a selection of trips is counted again from these codes
+        self.cell_codes = np.full(len(data), -1, dtype=np.int32)
+        self.cell_codes[valid] = cell_codes
+
+    def select_rows(self, rows):
+        """
+        :param rows: The positions of the trips to count, e.g. from TimeIndex.get_rows, None counts all trips.
+        :return: A cube of the selected trips, sharing the stations and categories with this cube.
+        """
+        if rows is None:
+            return self
+        cube = copy.copy(self)
+        selected = self.cell_codes[rows]
+        cube.counts = np.bincount(selected[selected >= 0], minlength=self.counts.size).reshape(self.counts.shape)
+        return cube
+
+    def get_counts(self, user_types=None, genders=None):
+        """
+        :param user_types: The user types to count, None or empty counts all.
+        :param genders: The genders to count, None or empty counts all.
+        :return: The number of trips of each station (indexed by the station codes).
+        """
+        selected = self.counts[:, _get_indexes(self.user_types, user_types), :]
+        selected = selected[:, :, _get_indexes(self.genders, genders)]
+        return selected.sum(axis=(1, 2))
+
+    def get_partition_counts(self, user_types=None, genders=None):
+        """
+        Counts every combination of the selected user types and genders at once. A dimension without selection is not
+        split, e.g. only user types selected gives one combination per user type over all genders.
+        :param user_types: The user types to split by, None or empty does not split by user type.
+        :param genders: The genders to split by, None or empty does not split by gender.
+        :return: The combinations as (user type, gender) tuples with None for a dimension not split and the number of
+        trips of each station (rows, indexed by the station codes) and combination (columns).
+        """
+        user_type_indexes = _get_indexes(self.user_types, user_types)
+        gender_indexes = _get_indexes(self.genders, genders)
+        selected = self.counts[:, user_type_indexes, :][:, :, gender_indexes]
+
+        split_user_types = user_types is not None and len(user_types) > 0
+        split_genders = genders is not None and len(genders) > 0
+        if not split_user_types:
+            selected = selected.sum(axis=1, keepdims=True)
+        if not split_genders:
+            selected = selected.sum(axis=2, keepdims=True)
+
+        combinations = [
+            (self.user_types[user_type_index] if split_user_types else None,
+             self.genders[gender_index] if split_genders else None)
+            for user_type_index in (user_type_indexes if split_user_types else [None])
+            for gender_index in (gender_indexes if split_genders else [None])
+        ]
+        return combinations, selected.reshape(len(selected), -1)
+
+    def get_station_counts(self, user_types=None, genders=None):
+        """
+        :param user_types: The user types to count, None or empty counts all.
+        :param genders: The genders to count, None or empty counts all.
+        :return: The stations with at least one trip and the columns Station ID, Name, Latitude, Longitude and Trip
+        Count.
+        """
+        return create_station_counts(self.dimension, self.get_counts(user_types, genders))
+
+
+class TripStatistics:
+    """
+    Totals of the dataset "stations", computed once per data version from the station cube and read by the numbers
+    and the map center of the pages "Nutzung Stationen".
+    """
+
+    def __init__(self, cube):
+        station_totals = cube.counts.sum(axis=(1, 2))
+        stations = cube.dimension.stations[station_totals > 0]
+
+        self.trip_count = int(station_totals.sum())
+        self.station_count = len(stations)
+        self.user_type_trip_counts = dict(zip(cube.user_types, cube.counts.sum(axis=(0, 2)).tolist()))
+        self.gender_trip_counts = dict(zip(cube.genders, cube.counts.sum(axis=(0, 1)).tolist()))
+        self.user_type_station_counts = dict(zip(cube.user_types,
+                                                 np.count_nonzero(cube.counts.sum(axis=2), axis=0).tolist()))
+        self.gender_station_counts = dict(zip(cube.genders,
+                                              np.count_nonzero(cube.counts.sum(axis=1), axis=0).tolist()))
+        self.center_lat = (stations['Latitude'].max() - stations['Latitude'].min()) / 2 + stations['Latitude'].min()
+        self.center_lon = (stations['Longitude'].max() - stations['Longitude'].min()) / 2 + stations['Longitude'].min()
+
+
+class TimeIndex:
+    """
+    Positions of the trips sorted by Start Time, built once when the dataset is loaded. A date range is a slice of the
+    sorted positions found by binary search, an hour of the day or a weekday (local time) is a slice of the positions
+    sorted by hour or weekday. A time window costs O(log n + k) for k selected trips instead of a scan of all trips.
+    """
+
+    def __init__(self, data):
+        start_times = data['Start Time']
+        position_type = np.int32 if len(data) < np.iinfo(np.int32).max else np.int64
+
+        times = start_times.values.view(np.int64)
+        self.order = np.argsort(times, kind='stable').astype(position_type)
+        self.times = times[self.order]
+        # position of each trip in the sorted order, a date range of selected trips is checked on these
+        self.ranks = np.empty(len(data), dtype=position_type)
+        self.ranks[self.order] = np.arange(len(data), dtype=position_type)
+
+        self.hours = start_times.dt.hour.to_numpy(dtype=np.int8)
+        self.weekdays = start_times.dt.weekday.to_numpy(dtype=np.int8)
+        self.hour_order, self.hour_offsets = self._create_offsets(self.hours, 24)
+        self.weekday_order, self.weekday_offsets = self._create_offsets(self.weekdays, 7)
+
+        self.timezone = start_times.dt.tz
+        self.first_day = start_times.min().normalize() if len(data) > 0 else None
+        # calendar days, a day with a switch to or from daylight saving time has 23 or 25 hours
+        self.day_count = (start_times.max().date() - start_times.min().date()).days + 1 if len(data) > 0 else 0
+
+    def get_day(self, day):
+        """
+        :param day: The number of days since the first day.
+        :return: The midnight (local time) starting the day.
+        """
+        # DateOffset adds calendar days in local time, Timedelta(days=1) would add 24 hours across a switch to or from
+        # daylight saving time
+        return self.first_day + pd.DateOffset(days=day)
+
+    def _create_offsets(self, values, size):
+        # positions sorted by value and Start Time, the positions of value v are order[offsets[v]:offsets[v + 1]]
+        order = self.order[np.argsort(values[self.order], kind='stable')]
+        offsets = np.searchsorted(values[order], np.arange(size + 1))
+        return order, offsets
+
+    def get_range(self, start=None, end=None):
+        """
+        :param start: The first time (Timestamp) to select, None selects from the first trip.
+        :param end: The time (Timestamp) after the last time to select, None selects to the last trip.
+        :return: The slice of the sorted positions (order) within the range.
+        """
+        lower = 0 if start is None else np.searchsorted(self.times, start.value, side='left')
+        upper = len(self.times) if end is None else np.searchsorted(self.times, end.value, side='left')
+        return lower, max(lower, upper)
+
+    def get_rows(self, start=None, end=None, hours=None, weekdays=None):
+        """
+        Selects the trips of a time window. The smallest of the selections by date range, hours and weekdays is taken
+        from the index, the other selections are checked on its trips only.
+        :param start: The first time (Timestamp) to select, None selects from the first trip.
+        :param end: The time (Timestamp) after the last time to select, None selects to the last trip.
+        :param hours: The hours of the day (0 - 23) to select, None or empty selects all.
+        :param weekdays: The weekdays (0 = Monday) to select, None or empty selects all.
+        :return: The positions of the selected trips, None if the window selects all trips.
+        """
+        hours = sorted(set(hours)) if hours is not None and 0 < len(hours) < 24 else None
+        weekdays = sorted(set(weekdays)) if weekdays is not None and 0 < len(weekdays) < 7 else None
+        lower, upper = self.get_range(start, end)
+        selections = []
+        if start is not None or end is not None:
+            selections.append((upper - lower, 'range'))
+        if hours is not None:
+            selections.append((sum(self.hour_offsets[hour + 1] - self.hour_offsets[hour] for hour in hours), 'hours'))
+        if weekdays is not None:
+            selections.append((sum(self.weekday_offsets[weekday + 1] - self.weekday_offsets[weekday]
+                                   for weekday in weekdays), 'weekdays'))
+        if len(selections) == 0:
+            return None
+
+        _, smallest = min(selections)
+        if smallest == 'range':
+            rows = self.order[lower:upper]
+        elif smallest == 'hours':
+            rows = np.concatenate([self.hour_order[self.hour_offsets[hour]:self.hour_offsets[hour + 1]]
+                                   for hour in hours])
+        else:
+            rows = np.concatenate([self.weekday_order[self.weekday_offsets[weekday]:self.weekday_offsets[weekday + 1]]
+                                   for weekday in weekdays])
+
+        if smallest != 'range' and (start is not None or end is not None):
+            ranks = self.ranks[rows]
+            rows = rows[(ranks >= lower) & (ranks < upper)]
+        if smallest != 'hours' and hours is not None:
+            rows = rows[np.isin(self.hours[rows], hours)]
+        if smallest != 'weekdays' and weekdays is not None:
+            rows = rows[np.isin(self.weekdays[rows], weekdays)]
+        return rows
+
+
+class WeatherCube:
+    """
+    Number of trips per start station, weather condition, user type and gender, counted once when the dataset is
+    loaded. A weather condition is a combination of weather_main, a temperature bin and a wind speed bin occurring in
+    the dataset, there are at most as many as hours of weather data. A weather filter sums the counts of the selected
+    conditions instead of scanning the float columns of the trips.
+    """
+
+    def __init__(self, data, cube):
+        self.cube = cube
+        if not all(column in data.columns for column in weather_columns):
+            # the month has no weather data (see ingest.py), no trip is in any weather condition
+            data = pd.DataFrame({'weather_main': pd.Categorical([None] * len(data)),
+                                 'temp': np.full(len(data), np.nan), 'wind_speed': np.full(len(data), np.nan)})
+
+        weather_mains = pd.Categorical(data['weather_main'])
+        self.weather_mains = list(weather_mains.categories)
+        temperature_bins = np.floor(data['temp'].to_numpy(dtype=np.float64) / temperature_bin_width)
+        wind_speed_bins = np.floor(data['wind_speed'].to_numpy(dtype=np.float64) / wind_speed_bin_width)
+        valid = (weather_mains.codes >= 0) & np.isfinite(temperature_bins) & np.isfinite(wind_speed_bins)
+
+        # a condition is encoded as one integer, factorized to the conditions occurring in the dataset
+        encoded = (weather_mains.codes[valid].astype(np.int64) << 32) + \
+                  ((temperature_bins[valid].astype(np.int64) + (1 << 15)) << 16) + \
+                  (wind_speed_bins[valid].astype(np.int64) + (1 << 15))
+        condition_codes, conditions = pd.factorize(encoded)
+        self.condition_weather_mains = (conditions >> 32).astype(np.int16)
+        self.condition_temperature_bins = (((conditions >> 16) & 0xFFFF) - (1 << 15)).astype(np.int16)
+        self.condition_wind_speed_bins = ((conditions & 0xFFFF) - (1 << 15)).astype(np.int16)
+        self.condition_codes = np.full(len(data), -1, dtype=np.int32)
+        self.condition_codes[valid] = condition_codes
+
+        # the cells of the station cube split by condition
+        cell_size = len(cube.user_types) * len(cube.genders)
+        shape = (len(cube.dimension.ids), len(conditions), len(cube.user_types), len(cube.genders))
+        counted = (cube.cell_codes >= 0) & (self.condition_codes >= 0)
+        cell_codes = cube.cell_codes[counted].astype(np.int64)
+        cell_codes = (cell_codes // cell_size * len(conditions) + self.condition_codes[counted]) * cell_size + \
+            cell_codes % cell_size
+        self.counts = np.bincount(cell_codes, minlength=int(np.prod(shape))).astype(np.int32).reshape(shape)
+
+    def get_conditions(self, weather_mains=None, temperatures=None, wind_speeds=None):
+        """
+        :param weather_mains: The weather_main values to select, None or empty selects all.
+        :param temperatures: The lowest and highest temperature in °C (multiples of temperature_bin_width), None for an
+        open end, None selects all.
+        :param wind_speeds: The lowest and highest wind speed in m/s (multiples of wind_speed_bin_width), None for an
+        open end, None selects all.
+        :return: Boolean array selecting the weather conditions.
+        """
+        selected = np.isin(self.condition_weather_mains, _get_indexes(self.weather_mains, weather_mains))
+        for bins, width, values in ((self.condition_temperature_bins, temperature_bin_width, temperatures),
+                                    (self.condition_wind_speed_bins, wind_speed_bin_width, wind_speeds)):
+            if values is None:
+                continue
+            low, high = values
+            if low is not None:
+                selected &= bins * width >= low
+            if high is not None:
+                selected &= (bins + 1) * width <= high
+        return selected
+
+    def select(self, weather_mains=None, temperatures=None, wind_speeds=None, rows=None):
+        """
+        :param weather_mains: The weather_main values to select, see get_conditions.
+        :param temperatures: The temperature range to select, see get_conditions.
+        :param wind_speeds: The wind speed range to select, see get_conditions.
+        :param rows: The positions of the trips to count, e.g. from TimeIndex.get_rows, None counts all trips.
+        :return: A station cube of the trips within the weather conditions.
+        """
+        selected = self.get_conditions(weather_mains, temperatures, wind_speeds)
+        if rows is not None:
+            # the conditions of the selected trips only
+            rows = rows[np.isin(self.condition_codes[rows], np.flatnonzero(selected))]
+            return self.cube.select_rows(rows)
+        cube = copy.copy(self.cube)
+        cube.counts = self.counts[:, selected].sum(axis=1, dtype=np.int64)
+        return cube
+
+
+class StationRowIndex:
+    """
+    Positions of the trips grouped by start station, built once when the dataset is loaded. The trips of a station are
+    a slice of the positions, a station is analysed from its k trips instead of a scan of all trips.
+    """
+
+    def __init__(self, station_codes, size):
+        position_type = np.int32 if len(station_codes) < np.iinfo(np.int32).max else np.int64
+        self.order = np.argsort(station_codes, kind='stable').astype(position_type)
+        # the trips of unknown stations (-1) are sorted first and not part of any slice
+        self.offsets = np.searchsorted(station_codes[self.order], np.arange(size + 1))
+
+    def get_rows(self, codes):
+        """
+        :param codes: The codes of the stations.
+        :return: The positions of the trips started at the stations.
+        """
+        return np.concatenate([self.order[self.offsets[code]:self.offsets[code + 1]] for code in codes] +
+                              [np.empty(0, dtype=self.order.dtype)])
+
+
+class StationGrid:
+    """
+    Uniform grid over the coordinates of the stations, built once when the dataset is loaded. A box or a polygon is
+    resolved to the grid cells overlapping its bounds, only the stations of these cells are tested.
+    """
+
+    def __init__(self, dimension, cell_degrees=0.005):
+        self.cell_degrees = cell_degrees
+        self.latitudes = dimension.stations['Latitude'].to_numpy(dtype=np.float64)
+        self.longitudes = dimension.stations['Longitude'].to_numpy(dtype=np.float64)
+        rows, cols = self._get_cells(self.latitudes, self.longitudes)
+        # the cells are numbered row by row, the cells of a row within the bounds are a range of cell codes
+        self.col_count = int(cols.max()) + 1 if len(cols) > 0 else 1
+        cell_codes = rows * self.col_count + cols
+        self.order = np.argsort(cell_codes, kind='stable')
+        self.cell_codes = cell_codes[self.order]
+
+    def _get_cells(self, latitudes, longitudes):
+        # offset by 90/180 degrees, so all cells are positive
+        return (np.floor((np.asarray(latitudes) + 90) / self.cell_degrees).astype(np.int64),
+                np.floor((np.asarray(longitudes) + 180) / self.cell_degrees).astype(np.int64))
+
+    def get_candidates(self, bounds):
+        """
+        :param bounds: (south, north, west, east) in degrees.
+        :return: The codes of the stations in the grid cells overlapping the bounds.
+        """
+        south, north, west, east = bounds
+        (row_low, row_high), (col_low, col_high) = self._get_cells([south, north], [west, east])
+        col_low, col_high = max(col_low, 0), min(col_high, self.col_count - 1)
+        if col_low > col_high:
+            return np.empty(0, dtype=self.order.dtype)
+        rows = np.arange(row_low, row_high + 1)
+        lower = np.searchsorted(self.cell_codes, rows * self.col_count + col_low, side='left')
+        upper = np.searchsorted(self.cell_codes, rows * self.col_count + col_high, side='right')
+        return np.concatenate([self.order[low:high] for low, high in zip(lower, upper)] +
+                              [np.empty(0, dtype=self.order.dtype)])
+
+    def select_box(self, bounds):
+        """
+        :param bounds: (south, north, west, east) in degrees.
+        :return: The codes of the stations within the bounds.
+        """
+        south, north, west, east = bounds
+        codes = self.get_candidates(bounds)
+        latitudes, longitudes = self.latitudes[codes], self.longitudes[codes]
+        return np.sort(codes[(latitudes >= south) & (latitudes <= north) & (longitudes >= west) & (longitudes <= east)])
+
+    def select_polygon(self, points):
+        """
+        :param points: The corners of the polygon as (longitude, latitude), e.g. the lasso points of a map.
+        :return: The codes of the stations within the polygon.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) < 3:
+            return np.empty(0, dtype=self.order.dtype)
+        codes = self.get_candidates((points[:, 1].min(), points[:, 1].max(), points[:, 0].min(), points[:, 0].max()))
+        latitudes, longitudes = self.latitudes[codes], self.longitudes[codes]
+
+        # ray casting: a station is within the polygon if a ray from it crosses an odd number of edges
+        inside = np.zeros(len(codes), dtype=bool)
+        for (lon_1, lat_1), (lon_2, lat_2) in zip(points, np.roll(points, -1, axis=0)):
+            if lat_1 == lat_2:
+                continue
+            crosses = (lat_1 > latitudes) != (lat_2 > latitudes)
+            crosses &= longitudes < (lon_2 - lon_1) * (latitudes - lat_1) / (lat_2 - lat_1) + lon_1
+            inside ^= crosses
+        return np.sort(codes[inside])
+
+
+class TripProfile:
+    """
+    Profile of a selection of trips, e.g. the trips of a station: the number of trips per hour of the day, user type and
+    gender, trip duration and end station. Only the selected trips are read.
+    """
+
+    def __init__(self, data, cube, time_index, end_codes, rows):
+        self.trip_count = len(rows)
+        self.hour_counts = np.bincount(time_index.hours[rows], minlength=24)
+
+        self.user_types = cube.user_types
+        self.genders = cube.genders
+        cell_size = len(self.user_types) * len(self.genders)
+        cell_codes = cube.cell_codes[rows]
+        self.user_type_gender_counts = np.bincount(cell_codes[cell_codes >= 0] % cell_size,
+                                                   minlength=cell_size).reshape(len(self.user_types), -1)
+
+        durations = data['Trip Duration'].take(rows).to_numpy(dtype=np.float64, na_value=np.nan) / 60
+        self.duration_counts = np.histogram(durations[~np.isnan(durations)], bins=duration_bins + [np.inf])[0]
+
+        end_codes = end_codes[rows]
+        ends, counts = np.unique(end_codes[end_codes >= 0], return_counts=True)
+        order = np.argsort(-counts, kind='stable')
+        self.end_stations = cube.dimension.get_attributes(ends[order]).assign(**{'Trip Count': counts[order]})
+
+
+class FlowMatrix:
+    """
+    Number of trips per pair of start and end station (flow), user type and gender, counted once when the dataset is
+    loaded. Only the pairs with trips are kept (sparse), the pairs are ordered by start station and number of trips, so
+    the strongest flows of a start station are a slice of the index.
+    """
+
+    def __init__(self, data, dimension, start_codes, end_codes):
+        self.dimension = dimension
+
+        user_types = pd.Categorical(data['User Type'])
+        genders = pd.Categorical(data['Gender'])
+        self.user_types = list(user_types.categories)
+        self.genders = list(genders.categories)
+
+        # a pair of stations is encoded as one integer, start code * number of stations + end code
+        valid = (start_codes >= 0) & (end_codes >= 0) & (user_types.codes >= 0) & (genders.codes >= 0)
+        pair_codes = start_codes[valid].astype(np.int64) * len(dimension.ids) + end_codes[valid]
+        pairs, pair_indexes = np.unique(pair_codes, return_inverse=True)
+
+        shape = (len(pairs), len(self.user_types), len(self.genders))
+        cell_codes = np.ravel_multi_index((pair_indexes, user_types.codes[valid], genders.codes[valid]), shape)
+        counts = np.bincount(cell_codes, minlength=int(np.prod(shape))).reshape(shape)
+
+        # index: by start station, the strongest flows first
+        starts = pairs // len(dimension.ids)
+        order = np.lexsort((-counts.sum(axis=(1, 2)), starts))
+        self.starts = starts[order]
+        self.ends = (pairs % len(dimension.ids))[order]
+        self.counts = counts[order]
+        self.start_offsets = np.searchsorted(self.starts, np.arange(len(dimension.ids) + 1))
+
+    def get_counts(self, user_types=None, genders=None):
+        """
+        :param user_types: The user types to count, None or empty counts all.
+        :param genders: The genders to count, None or empty counts all.
+        :return: The number of trips of each flow (same order as starts and ends).
+        """
+        selected = self.counts[:, _get_indexes(self.user_types, user_types), :]
+        selected = selected[:, :, _get_indexes(self.genders, genders)]
+        return selected.sum(axis=(1, 2))
+
+    def get_top_flows(self, k, user_types=None, genders=None, start_code=None):
+        """
+        :param k: The number of flows.
+        :param user_types: The user types to count, None or empty counts all.
+        :param genders: The genders to count, None or empty counts all.
+        :param start_code: Only the flows from this station, None for the flows of all stations.
+        :return: The k strongest flows between two different stations with the columns Start Station ID, Start Name,
+        Start Latitude, Start Longitude, End Station ID, End Name, End Latitude, End Longitude and Trip Count.
+        """
+        if start_code is not None:
+            flows = np.arange(self.start_offsets[start_code], self.start_offsets[start_code + 1])
+        else:
+            flows = np.arange(len(self.starts))
+        counts = self.get_counts(user_types, genders)[flows]
+        keep = (counts > 0) & (self.starts[flows] != self.ends[flows])
+        flows, counts = flows[keep], counts[keep]
+
+        if len(flows) > k:
+            top = np.argpartition(-counts, k - 1)[:k]
+            flows, counts = flows[top], counts[top]
+        order = np.argsort(-counts, kind='stable')
+        flows, counts = flows[order], counts[order]
+
+        df_start = self.dimension.get_attributes(self.starts[flows])
+        df_end = self.dimension.get_attributes(self.ends[flows])
+        return pd.concat([df_start.add_prefix('Start '), df_end.add_prefix('End ')], axis=1).assign(**{
+            'Trip Count': counts
+        })
+
+
+def get_station_dimension(month=None):
+    return get_derived('stations', 'station_dimension', lambda data, month: StationDimension(data), month)
+
+
+def get_station_codes(month=None, column='Start Station ID'):
+    """
+    :param month: The month (YYYY-MM), defaults to the latest available month.
+    :param column: The station ID column, Start Station ID or End Station ID.
+    :return: The station code of each trip of the dataset "stations" (same order as the dataset), read-only.
+    """
+    return get_derived('stations', 'station_codes {}'.format(column),
+                       lambda data, month: encode_stations(data, get_station_dimension(month), column), month)
+
+
+def get_start_counts(month=None, mask=None):
+    """
+    :param month: The month (YYYY-MM), defaults to the latest available month.
+    :param mask: Boolean array selecting the trips of the dataset "stations" to count, None counts all trips.
+    :return: The number of trips per start station, see create_station_counts.
+    """
+    dimension = get_station_dimension(month)
+    return create_station_counts(dimension, count_stations(get_station_codes(month), len(dimension.ids), mask))
+
+
+def get_station_cube(month=None):
+    return get_derived('stations', 'station_cube', lambda data, month: StationCube(
+        data, get_station_dimension(month), get_station_codes(month)
+    ), month)
+
+
+def get_flow_matrix(month=None):
+    return get_derived('stations', 'flow_matrix', lambda data, month: FlowMatrix(
+        data,
+        get_station_dimension(month),
+        get_station_codes(month, 'Start Station ID'),
+        get_station_codes(month, 'End Station ID')
+    ), month)
+
+
+def get_time_index(month=None):
+    return get_derived('stations', 'time_index', lambda data, month: TimeIndex(data), month)
+
+
+def get_station_rows(month=None):
+    return get_derived('stations', 'station_rows', lambda data, month: StationRowIndex(
+        get_station_codes(month), len(get_station_dimension(month).ids)
+    ), month)
+
+
+def get_station_grid(month=None):
+    return get_derived('stations', 'station_grid', lambda data, month: StationGrid(get_station_dimension(month)), month)
+
+
+def get_trip_profile(month=None, station_ids=()):
+    """
+    :param month: The month (YYYY-MM), defaults to the latest available month.
+    :param station_ids: The IDs of the start stations.
+    :return: The profile of the trips started at the stations, see TripProfile.
+    """
+    codes = get_station_dimension(month).get_codes(np.asarray(list(station_ids), dtype=np.float64))
+    rows = get_station_rows(month).get_rows(codes[codes >= 0])
+    return TripProfile(get_dataset('stations', month), get_station_cube(month), get_time_index(month),
+                       get_station_codes(month, 'End Station ID'), rows)
+
+
+def get_weather_cube(month=None):
+    return get_derived('stations', 'weather_cube', lambda data, month: WeatherCube(
+        data, get_station_cube(month)
+    ), month)
+
+
+def get_filtered_cube(month=None, time_window=None, weather=None):
+    """
+    :param month: The month (YYYY-MM), defaults to the latest available month.
+    :param time_window: The time window as (start, end, hours, weekdays), see TimeIndex.get_rows, None selects all
+    trips.
+    :param weather: The weather as (weather mains, temperatures, wind speeds), see WeatherCube.get_conditions, None
+    selects all trips.
+    :return: The station cube of the trips within the time window and the weather.
+    """
+    rows = get_time_index(month).get_rows(*time_window) if time_window is not None else None
+    if weather is None:
+        return get_station_cube(month).select_rows(rows)
+    return get_weather_cube(month).select(*weather, rows=rows)
+
+
+def get_trip_statistics(month=None):
+    return get_derived('stations', 'trip_statistics', lambda data, month: TripStatistics(
+        get_station_cube(month)
+    ), month)
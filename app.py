@@ -5,8 +5,11 @@ import dash_html_components as html
 import flask
 from dash.dependencies import Output, Input
 
+import catalog
+import data
 import navbar
 from apps import index
+from apps.flows import flows
 from apps.locationDistribution import locationDistribution
 from apps.notebooks import notebooks
 from apps.tripCount import tripCount
@@ -38,15 +41,16 @@ app.layout = html.Div(
     ]
 )
 
-# "complete" layout for validation when app is starting
+# "complete" layout for validation when app is starting, this also loads the data before the first request
 app.validation_layout = html.Div([
     app.layout,
     navbar.layout,
     index.layout,
-    tripCount.layout,
-    tripCountV2.layout,
-    tripCountV3.layout,
-    locationDistribution.layout,
+    tripCount.create_layout(),
+    tripCountV2.create_layout(),
+    tripCountV3.create_layout(),
+    flows.create_layout(),
+    locationDistribution.create_layout(),
     notebooks.layout
 ])
 
@@ -60,13 +64,15 @@ def display_page(pathname):
     elif pathname == '/home':
         return index.layout
     elif pathname == '/trip-count':
-        return tripCount.layout
+        return tripCount.create_layout()
     elif pathname == '/trip-count-v2':
-        return tripCountV2.layout
+        return tripCountV2.create_layout()
     elif pathname == '/trip-count-v3':
-        return tripCountV3.layout
+        return tripCountV3.create_layout()
+    elif pathname == '/flows':
+        return flows.create_layout()
     elif pathname == '/location-and-distribution':
-        return locationDistribution.layout
+        return locationDistribution.create_layout()
     elif pathname == '/notebooks':
         return notebooks.layout
     else:
@@ -77,8 +83,14 @@ navbar.register_callbacks(app)
 tripCount.register_callbacks(app)
 tripCountV2.register_callbacks(app)
 tripCountV3.register_callbacks(app)
+flows.register_callbacks(app)
 locationDistribution.register_callbacks(app)
 notebooks.register_callbacks(app)
 
+# new data files are loaded in the background, the pages use them without restarting the server
+data.start_reloader()
+# the statistics of the numeric columns are built (or read from the last run) in the background
+catalog.start_builder()
+
 if __name__ == '__main__':
     app.run_server(debug=False, use_reloader=False, port=5030)
@@ -0,0 +1,245 @@
+import dash_bootstrap_components as dbc
+import dash_core_components as dcc
+import dash_html_components as html
+import numpy as np
+import plotly.express as px
+from dash.dependencies import Output, Input
+
+from aggregation import get_flow_matrix, get_station_dimension, get_trip_statistics
+from data import get_default_month, get_month_options, get_source_description, snapshot
+from figures import build_figure, to_array
+from output_cache import OutputCache, normalize_selection
+
+# Prefix for IDs: fl
+
+i18n = {
+    '0': 'Unbekannt',
+    '1': 'männlich',
+    '2': 'weiblich',
+    'Customer': '24h- oder 3-Tagespass',
+    'Subscriber': 'Jahresmitglied'
+}
+
+# the flows are drawn in a few line widths, one trace per width
+line_widths = [1, 2, 4, 6, 8]
+line_colors = px.colors.sequential.OrRd[4:9]
+
+# outputs of callback_filter, (user types, genders, start station, number of flows, month, data version) -> outputs
+filter_outputs_cache = OutputCache()
+
+
+def get_station_options(month=None):
+    stations = get_station_dimension(month).stations.sort_values('Name')
+    return [dict(label=name, value=station_id) for name, station_id in zip(stations['Name'], stations['Station ID'])]
+
+
+def get_flows(user_types, genders, start_station_id, k, month=None):
+    flow_matrix = get_flow_matrix(month)
+    start_code = None
+    if start_station_id is not None:
+        start_code = flow_matrix.dimension.get_codes([start_station_id])[0]
+        if start_code < 0:
+            # the station is not part of the month
+            start_code = None
+    return flow_matrix.get_top_flows(k, user_types, genders, start_code)
+
+
+def get_flow_stats(data):
+    stats = '''
+        Angezeigte Fahrtströme: **{:,d}**  
+        Fahrten darin: **{:,d}**
+        '''.format(len(data), int(data['Trip Count'].sum()))
+    return stats
+
+
+def create_sidepanel(flow_stats):
+    sidepanel = html.Div(
+        [
+            html.H4('Fahrtströme'),
+            dcc.Markdown('_Datengrundlage_: **{}**'.format(get_source_description())),
+            dcc.Markdown('''
+            In der Karte werden die stärksten Fahrtströme als Linie von der Start- zur Zielstation angezeigt.
+            
+            * Die Breite und die Farbe der Linie zeigen an wie viele Fahrten zwischen den beiden Stationen stattfanden.
+            * Fahrten, die an der Startstation enden, werden nicht angezeigt.
+            
+            Fährt man mit der Maus über das Ende einer Linie, erscheinen die Stationsnamen und die Anzahl Fahrten.
+            
+            Mit Hilfe der unten verfügbaren Filter, lassen sich bestimmte Merkmale filtern oder nur die Fahrtströme
+            einer Startstation anzeigen.
+            '''),
+            dbc.Card(
+                [
+                    dbc.CardHeader('Filterauswahl'),
+                    dbc.CardBody(
+                        [
+                            html.H5('Monat', className='card-title'),
+                            dcc.Dropdown(
+                                id='fl-dropdown-month',
+                                options=get_month_options(),
+                                value=get_default_month(),
+                                clearable=False,
+                                className='mb-3'
+                            ),
+                            html.H5('Benutzerart', className='card-title'),
+                            dcc.Dropdown(
+                                id='fl-dropdown-user-type',
+                                options=[
+                                    dict(label=i18n['Subscriber'], value='Subscriber'),
+                                    dict(label=i18n['Customer'], value='Customer')
+                                ],
+                                multi=True,
+                                className='mb-3'
+                            ),
+                            html.H5('Geschlecht', className='card-title'),
+                            dcc.Dropdown(
+                                id='fl-dropdown-gender',
+                                options=[
+                                    dict(label=i18n['0'], value='0'),
+                                    dict(label=i18n['1'], value='1'),
+                                    dict(label=i18n['2'], value='2')
+                                ],
+                                multi=True,
+                                className='mb-3'
+                            ),
+                            html.H5('Startstation', className='card-title'),
+                            dcc.Dropdown(
+                                id='fl-dropdown-start-station',
+                                options=get_station_options(),
+                                placeholder='Alle Stationen',
+                                className='mb-3'
+                            ),
+                            html.H5('Anzahl Fahrtströme', className='card-title'),
+                            dcc.Slider(
+                                id='fl-slider-flows',
+                                min=10, max=200, step=10, value=50,
+                                marks={value: str(value) for value in [10, 50, 100, 150, 200]}
+                            ),
+                        ]
+                    )
+                ],
+                className='mb-3'
+            ),
+            dbc.Card(
+                [
+                    dbc.CardHeader('In Zahlen'),
+                    dbc.CardBody(
+                        [
+                            dcc.Markdown(flow_stats, id='fl-numbers-flow-stats-output'),
+                        ]
+                    )
+                ],
+                className='mb-3'
+            )
+        ]
+    )
+
+    return sidepanel
+
+
+def create_figure(data, statistics):
+    # figure as plain dict, see figures.py
+    max_trip_count = data['Trip Count'].max() if len(data) > 0 else 1
+    width_classes = np.minimum((data['Trip Count'].to_numpy() / max_trip_count * len(line_widths)).astype(int),
+                               len(line_widths) - 1)
+
+    traces = []
+    for width_class, (line_width, line_color) in enumerate(zip(line_widths, line_colors)):
+        df_class = data[width_classes == width_class]
+        if len(df_class) == 0:
+            continue
+        texts = ['{} → {}: {:,d} Fahrten'.format(start, end, count) for start, end, count
+                 in zip(df_class['Start Name'], df_class['End Name'], df_class['Trip Count'])]
+        # all lines of a width in one trace, separated by None
+        traces.append(dict(
+            type='scattermapbox',
+            lat=np.column_stack([to_array(df_class['Start Latitude']), to_array(df_class['End Latitude']),
+                                 [None] * len(df_class)]).ravel().tolist(),
+            lon=np.column_stack([to_array(df_class['Start Longitude']), to_array(df_class['End Longitude']),
+                                 [None] * len(df_class)]).ravel().tolist(),
+            mode='lines',
+            line=dict(width=line_width, color=line_color),
+            text=np.column_stack([texts, texts, [None] * len(df_class)]).ravel().tolist(),
+            hoverinfo='text',
+            showlegend=False,
+        ))
+
+    layout = dict(
+        margin={'r': 0, 't': 30, 'l': 0, 'b': 0},
+        mapbox=dict(
+            style='open-street-map',
+            center=dict(
+                lat=statistics.center_lat,
+                lon=statistics.center_lon
+            ),
+            pitch=0,
+            zoom=12
+        ),
+        width=1200, height=1600,
+        uirevision='fl'
+    )
+
+    return build_figure(traces, layout)
+
+
+def create_filter_outputs(user_types, genders, start_station_id, k, month):
+    data = get_flows(user_types, genders, start_station_id, k, month)
+    return create_figure(data, get_trip_statistics(month)), get_flow_stats(data)
+
+
+def create_layout():
+    """
+    Creates the layout from the current version of the data (see data.start_reloader).
+    """
+    figure, flow_stats = create_filter_outputs((), (), None, 50, get_default_month())
+    return dbc.Row(
+        [
+            dbc.Col(
+                [
+                    html.Div(create_sidepanel(flow_stats)),
+                ],
+                md=4
+            ),
+            dbc.Col(
+                [
+                    html.Div(
+                        dcc.Graph(
+                            id='fl-scattermapbox-fig',
+                            figure=figure,
+                            style={'width': '100%', 'height': '80vh', 'margin': "auto", "display": "block"},
+                            responsive=True
+                        )
+                    ),
+                ],
+                md=8
+            ),
+        ]
+    )
+
+
+def register_callbacks(app):
+    @app.callback(
+        Output('fl-dropdown-start-station', 'options'),
+        [Input('fl-dropdown-month', 'value')]
+    )
+    def callback_month(month_value):
+        return get_station_options(month_value)
+
+    @app.callback(
+        [Output('fl-scattermapbox-fig', 'figure'),
+         Output('fl-numbers-flow-stats-output', 'children')],
+        [Input('fl-dropdown-user-type', 'value'),
+         Input('fl-dropdown-gender', 'value'),
+         Input('fl-dropdown-start-station', 'value'),
+         Input('fl-slider-flows', 'value'),
+         Input('fl-dropdown-month', 'value')]
+    )
+    def callback_filter(user_type_value, gender_value, start_station_value, flows_value, month_value):
+        user_types = normalize_selection(user_type_value)
+        genders = normalize_selection(gender_value)
+        # the outputs are created from one version of the data, also if it is reloaded in the meantime
+        with snapshot('stations', month_value) as version:
+            key = (user_types, genders, start_station_value, flows_value, month_value, version)
+            return filter_outputs_cache.get(key, lambda: create_filter_outputs(user_types, genders,
+                                                                               start_station_value, flows_value,
+                                                                               month_value))
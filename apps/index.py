@@ -59,6 +59,13 @@ layout = dbc.Jumbotron(
                                                     href='/trip-count-v3'
                                                 ),
                                                 className='text-center'
+                                            ),
+                                            dbc.Col(
+                                                dbc.Button(
+                                                    "Fahrtströme", color="primary", className="mt-auto",
+                                                    href='/flows'
+                                                ),
+                                                className='text-center'
                                             )
                                         ]
                                     )
@@ -3,31 +3,25 @@ import dash_core_components as dcc
 import dash_daq as daq
 import dash_html_components as html
 import numpy as np
-import pandas as pd
 import plotly
-import plotly.graph_objects as go
 from dash.dependencies import Input, Output
-from plotly.subplots import make_subplots
 
-from data import read_df_month
+from catalog import get_column_entry
+from data import get_default_month, get_numeric_columns, get_source_description
+from figures import build_figure, get_axis_suffix, get_subplots_layout, to_array
 
 power_button_on_color = plotly.colors.qualitative.Plotly[2]
 
-df_month = read_df_month()
-
 column_excludes = [
     'timezone',
     'lat',
     'lon',
 ]
 
-numeric_columns = []
-for col in df_month.columns:
-    if (col not in column_excludes and (
-            df_month[col].dtype == np.float64
-            or df_month[col].dtype == np.int64
-            or isinstance(df_month[col].dtype, pd.Int64Dtype))):
-        numeric_columns.append(col)
+
+def get_feature_columns():
+    # from the parquet schema, the page is shown before the catalog is built (see catalog.start_builder)
+    return [col for col in get_numeric_columns() if col not in column_excludes]
 
 
 def get_histogram_options(disabled):
@@ -115,7 +109,7 @@ def create_boxplot_options():
 
 
 def get_feature_option(disabled):
-    return [{'label': val, 'value': val, 'disabled': disabled} for val in numeric_columns]
+    return [{'label': val, 'value': val, 'disabled': disabled} for val in get_feature_columns()]
 
 
 def create_checklist_features():
@@ -135,7 +129,7 @@ def create_sidepanel():
     sidepanel = html.Div(
         [
             html.H2('Histogramm und Boxplot'),
-            dcc.Markdown('_Datengrundlage_: **5000 zufällige Stichproben aus dem Monat Oktober 2019**'),
+            dcc.Markdown('_Datengrundlage_: **{}**'.format(get_source_description(get_default_month()))),
             dcc.Markdown('''
             Darstellung von Boxplots und Histogrammen für die verschiedenen Merkmale.
             '''),
@@ -172,48 +166,113 @@ def create_sidepanel():
     return sidepanel
 
 
-def create_figure(data, column, hist_show, hist_yaxis_log, box_show, box_mean):
+def create_histogram_trace(column, log, axis_suffix):
+    """
+    Creates the histogram as bars from the bins of the catalog (see catalog.create_column_entry), the figure contains
+    the bins instead of the values of all trips.
+    :param column: The column of the dataset "numeric".
+    :param log: The y axis is logarithmic, empty bins are left out instead of plotting log(0).
+    :param axis_suffix: The suffix of the axes of the histogram, see figures.get_axis_suffix.
+    :return: The bar trace.
+    """
+    entry = get_column_entry(column)
+    histogram = entry.get('histogram') if entry is not None else None
+    if histogram is None:
+        edges, counts, size = [], [], 1
+    else:
+        edges, counts, size = histogram['edges'], histogram['counts'], histogram['size']
+    labels = ['{:g} - {:g}: {:,d}'.format(edge, edge + size, count) for edge, count in zip(edges, counts)]
+    return dict(
+        type='bar',
+        name='',
+        # rounded, otherwise the sums of the edges add noise to the JSON (e.g. 40.660000000000004)
+        x=to_array(np.round(np.asarray(edges) + size / 2, 10)),
+        y=[None if log and count == 0 else int(count) for count in counts],
+        width=size,
+        hovertext=labels,
+        hoverinfo='text',
+        xaxis='x' + axis_suffix, yaxis='y' + axis_suffix
+    )
+
+
+def create_boxplot_traces(column, box_mean):
+    """
+    Creates the box plot from the statistics of the catalog (see catalog.create_column_entry), the figure contains the
+    quartiles, fences and a sample of the outliers instead of the values of all trips.
+    :param column: The column of the dataset "numeric".
+    :param box_mean: Shows the mean.
+    :return: The box and the outliers as scatter trace.
+    """
+    entry = get_column_entry(column)
+    statistics = entry.get('box') if entry is not None else None
+    if statistics is None:
+        return [], []
+    color = plotly.colors.qualitative.Plotly[0]
+    boxplot = dict(
+        type='box',
+        name='',
+        orientation='h',
+        y=[0],
+        q1=[statistics['q1']], median=[statistics['median']], q3=[statistics['q3']],
+        lowerfence=[statistics['lowerfence']], upperfence=[statistics['upperfence']],
+        mean=[statistics['mean']] if box_mean else None,
+        boxmean=box_mean,
+        boxpoints=False,
+        marker=dict(color=color),
+        xaxis='x', yaxis='y'
+    )
+    outliers = dict(
+        type='scatter',
+        name='',
+        mode='markers',
+        x=to_array(statistics['outliers']),
+        y=[0] * len(statistics['outliers']),
+        marker=dict(color=color, size=6),
+        hoverinfo='x',
+        xaxis='x', yaxis='y'
+    )
+    return [boxplot], [outliers]
+
+
+def create_figure(column, hist_show, hist_yaxis_log, box_show, box_mean):
+    # figure as plain dict, the axes of make_subplots are only created once (see figures.py)
     n_rows = (1 if hist_show else 0) + (1 if box_show else 0)
 
-    fig = make_subplots(
+    layout = get_subplots_layout(
         rows=n_rows, cols=1,
         shared_xaxes=True,
-        print_grid=False,
         vertical_spacing=0.05,
         y_title=column,
         row_heights=[0.5, 1] if hist_show and box_show else [1]
     )
+    traces = []
+    outliers = []
 
     if box_show:
-        boxplot = go.Box(
-            name='',
-            x=data[column],
-            boxmean=box_mean
-        )
-        _ = fig.add_trace(boxplot, 1, 1)
+        boxplot, outliers = create_boxplot_traces(column, box_mean)
+        traces.extend(boxplot)
+        layout['yaxis']['showticklabels'] = False
 
     if hist_show:
         hist_row_number = (2 if box_show else 1)
-        histogram = go.Histogram(
-            name='',
-            x=data[column]
-        )
-        _ = fig.add_trace(histogram, hist_row_number, 1)
+        axis_suffix = get_axis_suffix(hist_row_number)
+        traces.append(create_histogram_trace(column, hist_yaxis_log, axis_suffix))
 
-        fig.update_yaxes(
-            type='log' if hist_yaxis_log else 'linear',
-            row=hist_row_number
-        )
+        layout['yaxis' + axis_suffix]['type'] = 'log' if hist_yaxis_log else 'linear'
 
-    fig.update_layout(
+    # after the histogram, so it keeps its color of the colorway
+    traces.extend(outliers)
+
+    layout.update(
+        bargap=0,
         showlegend=False,
         margin={'r': 30, 't': 30, 'l': 60, 'b': 30},
     )
 
-    return fig
+    return build_figure(traces, layout)
 
 
-def create_box_hist_graphs(data, columns, hist_show, hist_yaxis_log, box_show, box_mean):
+def create_box_hist_graphs(columns, hist_show, hist_yaxis_log, box_show, box_mean):
     if len(columns) == 0:
         return None
 
@@ -221,8 +280,7 @@ def create_box_hist_graphs(data, columns, hist_show, hist_yaxis_log, box_show, b
     for idx, col in enumerate(columns):
         dbc_col = dbc.Col(
             [
-                dcc.Graph(figure=create_figure(data,
-                                               column=col,
+                dcc.Graph(figure=create_figure(column=col,
                                                hist_show=hist_show,
                                                hist_yaxis_log=hist_yaxis_log,
                                                box_show=box_show,
@@ -235,20 +293,24 @@ def create_box_hist_graphs(data, columns, hist_show, hist_yaxis_log, box_show, b
     return dbc_cols
 
 
-layout = dbc.Row(
-    [
-        dbc.Col(
-            [
-                create_sidepanel()
-            ],
-            md=4
-        ),
-        dbc.Col(
-            id='box-hist-graphs',
-            md=8
-        ),
-    ]
-)
+def create_layout():
+    """
+    Creates the layout from the current version of the data (see data.start_reloader).
+    """
+    return dbc.Row(
+        [
+            dbc.Col(
+                [
+                    create_sidepanel()
+                ],
+                md=4
+            ),
+            dbc.Col(
+                id='box-hist-graphs',
+                md=8
+            ),
+        ]
+    )
 
 
 def register_callbacks(app):
@@ -271,7 +333,6 @@ def register_callbacks(app):
             return None, get_histogram_options(True), get_boxplot_options(True), get_feature_option(True)
 
         graphs = create_box_hist_graphs(
-            df_month,
             columns=checklist_features_value,
             hist_show=histogram_on,
             hist_yaxis_log='log' in histogram_options_values,
@@ -1,16 +1,17 @@
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
-import pandas as pd
 import plotly.graph_objects as go
 from dash.dependencies import Output, Input
 
-from data import read_df_month
+import time_filter
+from aggregation import get_filtered_cube, get_start_counts, get_trip_statistics
+from data import get_default_month, get_month_options, get_source_description, snapshot
+from time_filter import create_time_filter, get_time_window
+from weather_filter import create_weather_filter, get_weather
 
 # Prefix for IDs: tc
 
-df_month = read_df_month()
-
 i18n = {
     '0': 'Unbekannt',
     '1': 'männlich',
@@ -20,35 +21,18 @@ i18n = {
 }
 
 
-def get_start_count_month(data):
-    df_start_count_month = pd.pivot_table(
-        data,
-        index=['Start Station Name', 'Start Station Latitude', 'Start Station Longitude'],
-        values=['Trip Duration'],
-        aggfunc='count'
-    )
-
-    df_start_count_month = df_start_count_month.reset_index().rename(columns={
-        'Start Station Name': 'Name',
-        'Start Station Latitude': 'Latitude',
-        'Start Station Longitude': 'Longitude',
-        'Trip Duration': 'Trip Count'
-    })
-
-    return df_start_count_month
+def get_start_count_month(month=None, mask=None):
+    return get_start_counts(month, mask)
 
 
-def filter_data(user_types, genders):
-    df_filtered = df_month
-    if user_types is not None and len(user_types) > 0:
-        df_filtered = df_filtered[df_filtered['User Type'].isin(user_types)]
-    if genders is not None and len(genders) > 0:
-        df_filtered = df_filtered[df_filtered['Gender'].isin(genders)]
-    return df_filtered
+def filter_data(month, user_types, genders, time_window, weather):
+    # the trips of the time window are counted from the sorted Start Time index, the weather is a sum over the weather
+    # conditions and the user types and genders are a slice of the counts
+    return get_filtered_cube(month, time_window, weather).get_station_counts(user_types, genders)
 
 
-def get_trip_stats(data):
-    total = get_start_count_month(df_month)['Trip Count'].sum()
+def get_trip_stats(data, month=None):
+    total = get_trip_statistics(month).trip_count
     actual_showing = data['Trip Count'].sum()
     stats = '''
         Gesamt: **{:,d}**  
@@ -57,8 +41,8 @@ def get_trip_stats(data):
     return stats
 
 
-def get_station_stats(data):
-    total = get_start_count_month(df_month)['Trip Count'].count()
+def get_station_stats(data, month=None):
+    total = get_trip_statistics(month).station_count
     actual_showing = data['Trip Count'].count()
     stats = '''
         Gesamt: **{:,d}**  
@@ -71,7 +55,7 @@ def create_sidepanel():
     sidepanel = html.Div(
         [
             html.H4(['Nutzung Stationen', html.Small(' (Version 1)', className='text-muted')]),
-            dcc.Markdown('_Datengrundlage_: **5000 zufällige Stichproben aus dem Monat Oktober 2019**'),
+            dcc.Markdown('_Datengrundlage_: **{}**'.format(get_source_description())),
             dcc.Markdown('''
             In der Karte werden die Stationen in Form eines Kreises angezeigt.
             
@@ -88,6 +72,14 @@ def create_sidepanel():
                     dbc.CardHeader('Filterauswahl'),
                     dbc.CardBody(
                         [
+                            html.H5('Monat', className='card-title'),
+                            dcc.Dropdown(
+                                id='tc-dropdown-month',
+                                options=get_month_options(),
+                                value=get_default_month(),
+                                clearable=False,
+                                className='mb-3'
+                            ),
                             html.H5('Benutzerart', className='card-title'),
                             dcc.Dropdown(
                                 id='tc-dropdown-user-type',
@@ -106,8 +98,11 @@ def create_sidepanel():
                                     dict(label=i18n['1'], value='1'),
                                     dict(label=i18n['2'], value='2')
                                 ],
-                                multi=True
+                                multi=True,
+                                className='mb-3'
                             ),
+                            *create_time_filter('tc'),
+                            *create_weather_filter('tc'),
                         ]
                     )
                 ],
@@ -168,47 +163,53 @@ def create_figure(data):
     return fig_go
 
 
-layout = dbc.Row(
-    [
-        dbc.Col(
-            [
-                html.Div(create_sidepanel()),
-                html.Div(
-                    [
-                        html.Div(id='tc-scattermapbox-fig-output'),
-                        html.Div(id='tc-scattermapbox-fig-selected-output'),
-                        html.Div(id='tc-scattermapbox-fig-hover-output'),
-                    ],
-                    hidden=True
-                ),
-                html.Div(
-                    [
-                        html.Div(id='tc-dropdown-user-type-output'),
-                        html.Div(id='tc-dropdown-gender-output'),
-                    ]
-                )
-
-            ],
-            md=4
-        ),
-        dbc.Col(
-            [
-                html.Div(
-                    dcc.Graph(
-                        id='tc-scattermapbox-fig',
-                        figure=create_figure(get_start_count_month(df_month)),
-                        style={'width': '100%', 'height': '80vh', 'margin': "auto", "display": "block"},
-                        responsive=True
+def create_layout():
+    """
+    Creates the layout from the current version of the data (see data.start_reloader).
+    """
+    return dbc.Row(
+        [
+            dbc.Col(
+                [
+                    html.Div(create_sidepanel()),
+                    html.Div(
+                        [
+                            html.Div(id='tc-scattermapbox-fig-output'),
+                            html.Div(id='tc-scattermapbox-fig-selected-output'),
+                            html.Div(id='tc-scattermapbox-fig-hover-output'),
+                        ],
+                        hidden=True
+                    ),
+                    html.Div(
+                        [
+                            html.Div(id='tc-dropdown-user-type-output'),
+                            html.Div(id='tc-dropdown-gender-output'),
+                        ]
                     )
-                ),
-            ],
-            md=8
-        ),
-    ]
-)
+
+                ],
+                md=4
+            ),
+            dbc.Col(
+                [
+                    html.Div(
+                        dcc.Graph(
+                            id='tc-scattermapbox-fig',
+                            figure=create_figure(get_start_count_month()),
+                            style={'width': '100%', 'height': '80vh', 'margin': "auto", "display": "block"},
+                            responsive=True
+                        )
+                    ),
+                ],
+                md=8
+            ),
+        ]
+    )
 
 
 def register_callbacks(app):
+    time_filter.register_callbacks(app, 'tc')
+
     @app.callback(
         Output('tc-scattermapbox-fig-output', 'children'),
         [Input('tc-scattermapbox-fig', 'clickData')]
@@ -233,11 +234,21 @@ def register_callbacks(app):
     @app.callback(
         Output('tc-scattermapbox-fig', 'figure'),
         [Input('tc-dropdown-user-type', 'value'),
-         Input('tc-dropdown-gender', 'value')]
+         Input('tc-dropdown-gender', 'value'),
+         Input('tc-dropdown-month', 'value'),
+         Input('tc-slider-days', 'value'),
+         Input('tc-slider-hours', 'value'),
+         Input('tc-dropdown-weekday', 'value'),
+         Input('tc-dropdown-weather', 'value'),
+         Input('tc-slider-temperature', 'value'),
+         Input('tc-slider-wind-speed', 'value')]
     )
-    def callback_filter(user_type_value, gender_value):
-        filtered_data = filter_data(user_type_value, gender_value)
-        data = get_start_count_month(filtered_data)
+    def callback_filter(user_type_value, gender_value, month_value, days_value, hours_value, weekday_value,
+                        weather_value, temperature_value, wind_speed_value):
+        weather = get_weather(weather_value, temperature_value, wind_speed_value)
+        with snapshot('stations', month_value):
+            time_window = get_time_window(month_value, days_value, hours_value, weekday_value)
+            data = filter_data(month_value, user_type_value, gender_value, time_window, weather)
         fig = create_figure(data)
 
         return fig
@@ -1,24 +1,23 @@
+import os
 import typing
 
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
-import pandas as pd
+import numpy as np
 import plotly.express as px
-import plotly.graph_objects as go
-from dash.dependencies import Output, Input
+from dash.dependencies import ClientsideFunction, Output, Input
 
-from data import read_df_month
+import time_filter
+from aggregation import get_filtered_cube, get_station_cube, get_trip_statistics
+from data import get_default_month, get_month_options, get_source_description, snapshot
+from figures import build_figure, to_array
+from output_cache import OutputCache, normalize_selection
+from time_filter import create_time_filter, get_time_window
+from weather_filter import create_weather_filter, get_weather
 
 # Prefix for IDs: tc2
 
-df_month = read_df_month()
-
-center_lat = (df_month['Start Station Latitude'].max() - df_month['Start Station Latitude'].min()) / 2 + df_month[
-    'Start Station Latitude'].min()
-center_lon = (df_month['Start Station Longitude'].max() - df_month['Start Station Longitude'].min()) / 2 + df_month[
-    'Start Station Longitude'].min()
-
 i18n = {
     '0': 'Unbekannt',
     '1': 'männlich',
@@ -41,107 +40,83 @@ colormap = {
     'Customer-2': px.colors.sequential.Plotly3[10],
 }
 
+# outputs of callback_filter,
+# (user types, genders, month, time window, weather, data version) -> (figure, station stats, trip stats)
+filter_outputs_cache = OutputCache()
 
-def get_start_count_month(data):
-    df_start_count_month = pd.pivot_table(
-        data,
-        index=['Start Station Name', 'Start Station Latitude', 'Start Station Longitude'],
-        values=['Trip Duration'],
-        aggfunc='count'
-    )
+# the filters are applied in the browser from the counts of the cube (see assets/tripCountV2.js), only a change of the
+# month is sent to the server, set DAVI_CLIENTSIDE_FILTER=0 to apply the filters on the server
+clientside_filter = os.environ.get('DAVI_CLIENTSIDE_FILTER', '1') == '1'
 
-    df_start_count_month = df_start_count_month.reset_index().rename(columns={
-        'Start Station Name': 'Name',
-        'Start Station Latitude': 'Latitude',
-        'Start Station Longitude': 'Longitude',
-        'Trip Duration': 'Trip Count'
-    })
 
-    return df_start_count_month
+def filter_data(cube, user_types, genders):
+    # all combinations are counted at once from the cube, the station attributes are joined only once
+    combinations, counts = cube.get_partition_counts(user_types, genders)
+    plotted = np.flatnonzero(counts.any(axis=1))
+    stations = cube.dimension.get_attributes(plotted)
+    counts = counts[plotted]
+    trip_counts = counts.sum(axis=0)
+    station_counts = np.count_nonzero(counts, axis=0)
 
-
-def filter_data(data, user_types, genders):
     df_result = []
-
-    if user_types is not None and len(user_types) > 0:
-        for user_type in user_types:
-            if genders is not None and len(genders) > 0:
-                for gender in genders:
-                    df_filtered = data[(data['User Type'] == user_type) & (data['Gender'] == gender)]
-                    df_result.append(
-                        (
-                            '{}-{}'.format(user_type, gender),
-                            '{} & {}'.format(i18n[user_type], i18n[gender]),
-                            df_filtered
-                        )
-                    )
-            else:
-                df_filtered = data[data['User Type'] == user_type]
-                df_result.append(
-                    (
-                        '{}'.format(user_type),
-                        '{}'.format(i18n[user_type]),
-                        df_filtered
-                    )
-                )
-    else:
-        if genders is not None and len(genders) > 0:
-            for gender in genders:
-                df_filtered = data[data['Gender'] == gender]
-                df_result.append(
-                    (
-                        '{}'.format(gender),
-                        '{}'.format(i18n[gender]),
-                        df_filtered
-                    )
-                )
+    for i, combination in enumerate(combinations):
+        values = [value for value in combination if value is not None]
+        df_result.append(
+            (
+                '-'.join(values),
+                ' & '.join(i18n[value] for value in values),
+                stations.assign(**{'Trip Count': counts[:, i]})[counts[:, i] > 0].reset_index(drop=True),
+                int(trip_counts[i]),
+                int(station_counts[i])
+            )
+        )
 
     return df_result
 
 
-def get_trip_stats(data):
-    total = get_start_count_month(df_month)['Trip Count'].sum()
+def get_trip_stats(data, statistics, shown=None):
+    # shown: the number of trips without filter (within the time window), None for all trips
+    total = statistics.trip_count
     if isinstance(data, typing.List):
         # filtered statistics, show numbers of each filter
         stats = 'Gesamt: **{:,d}**  \n'.format(total)
         for data_entry in data:
-            trip_sum = get_start_count_month(data_entry[2])['Trip Count'].sum()
+            trip_sum = data_entry[3]
             stats = stats + data_entry[1] + ': **{:,d}**  \n'.format(trip_sum) + '  '
         return stats
     else:
-        # no filter active, normal dataset given
-        actual_showing = data['Trip Count'].sum()
+        # no filter active, all trips are shown
         stats = '''
             Gesamt: **{:,d}**  
             Aktuell angezeigt: **{:,d}**
-            '''.format(total, actual_showing)
+            '''.format(total, total if shown is None else shown)
         return stats
 
 
-def get_station_stats(data):
-    total = get_start_count_month(df_month)['Trip Count'].count()
+def get_station_stats(data, statistics, shown=None):
+    # shown: the number of stations without filter (within the time window), None for all stations
+    total = statistics.station_count
     if isinstance(data, typing.List):
         # filtered statistics, show numbers of each filter
         stats = 'Gesamt: **{:,d}**  \n'.format(total)
         for data_entry in data:
-            station_count = get_start_count_month(data_entry[2])['Trip Count'].count()
+            station_count = data_entry[4]
             stats = stats + data_entry[1] + ': **{:,d}**  \n'.format(station_count) + '  '
         return stats
     else:
-        # no filter active, normal dataset given
-        actual_showing = data['Trip Count'].count()
+        # no filter active, all trips are shown
         stats = '''
             Gesamt: **{:,d}**  
             Aktuell angezeigt: **{:,d}**
-            '''.format(total, actual_showing)
+            '''.format(total, total if shown is None else shown)
         return stats
 
 
-def create_sidepanel():
+def create_sidepanel(statistics):
     sidepanel = html.Div(
         [
             html.H4(['Nutzung Stationen', html.Small(' (Version 2)', className='text-muted')]),
-            dcc.Markdown('_Datengrundlage_: **5000 zufällige Stichproben aus dem Monat Oktober 2019**'),
+            dcc.Markdown('_Datengrundlage_: **{}**'.format(get_source_description())),
             dcc.Markdown('''
             **Inputs Testperson zu Version 1**
             
@@ -169,6 +144,14 @@ def create_sidepanel():
                     dbc.CardHeader('Filterauswahl'),
                     dbc.CardBody(
                         [
+                            html.H5('Monat', className='card-title'),
+                            dcc.Dropdown(
+                                id='tc2-dropdown-month',
+                                options=get_month_options(),
+                                value=get_default_month(),
+                                clearable=False,
+                                className='mb-3'
+                            ),
                             html.H5('Benutzerart', className='card-title'),
                             dcc.Dropdown(
                                 id='tc2-dropdown-user-type',
@@ -187,8 +170,11 @@ def create_sidepanel():
                                     dict(label=i18n['1'], value='1'),
                                     dict(label=i18n['2'], value='2')
                                 ],
-                                multi=True
+                                multi=True,
+                                className='mb-3'
                             ),
+                            *create_time_filter('tc2'),
+                            *create_weather_filter('tc2'),
                         ]
                     )
                 ],
@@ -201,11 +187,11 @@ def create_sidepanel():
                     dbc.CardBody(
                         [
                             html.H5('Fahrten', className='card-title'),
-                            dcc.Markdown(get_trip_stats(get_start_count_month(df_month)),
+                            dcc.Markdown(get_trip_stats(None, statistics),
                                          id='tc2-numbers-trip-stats-output'),
                             html.Hr(),
                             html.H5('Stationen', className='card-title'),
-                            dcc.Markdown(get_station_stats(get_start_count_month(df_month)),
+                            dcc.Markdown(get_station_stats(None, statistics),
                                          id='tc2-numbers-station-stats-output'),
                         ]
                     )
@@ -219,131 +205,174 @@ def create_sidepanel():
     return sidepanel
 
 
-def create_scattermapbox(data):
-    figure = go.Figure()
+def create_layout_mapbox(statistics):
+    return dict(
+        margin={'r': 0, 't': 30, 'l': 0, 'b': 0},
+        mapbox=dict(
+            style='open-street-map',
+            center=dict(
+                lat=statistics.center_lat,
+                lon=statistics.center_lon
+            ),
+            pitch=0,
+            zoom=12
+        ),
+        width=1200, height=1600
+    )
+
 
-    data_plot = get_start_count_month(data)
+def create_scattermapbox(cube, statistics):
+    # figures as plain dicts, see figures.py
+    data_plot = cube.get_station_counts()
 
-    scattermapbox = go.Scattermapbox(
-        lat=data_plot['Latitude'], lon=data_plot['Longitude'],
+    scattermapbox = dict(
+        type='scattermapbox',
+        lat=to_array(data_plot['Latitude']), lon=to_array(data_plot['Longitude']),
         mode='markers',
-        marker=go.scattermapbox.Marker(
-            size=data_plot['Trip Count'],
-            color=data_plot['Trip Count'],
+        marker=dict(
+            size=to_array(data_plot['Trip Count']),
+            color=to_array(data_plot['Trip Count']),
             opacity=0.7,
             showscale=True,
             sizemode='area',
             sizeref=data_plot['Trip Count'].max() / 50 ** 2,
             colorbar=dict(
-                title='Anzahl Fahrten',
+                title=dict(text='Anzahl Fahrten'),
                 tickformat='.%2f'
             )
         ),
-        text=data_plot['Name'],
+        text=to_array(data_plot['Name']),
         hoverinfo='text',
     )
 
-    _ = figure.add_trace(scattermapbox)
-
-    _ = figure.update_layout(
-        margin={'r': 0, 't': 30, 'l': 0, 'b': 0},
-        mapbox=dict(
-            style='open-street-map',
-            center=dict(
-                lat=center_lat,
-                lon=center_lon
-            ),
-            pitch=0,
-            zoom=12
-        ),
-        width=1200, height=1600
-    )
-
-    return figure
-
+    return build_figure([scattermapbox], create_layout_mapbox(statistics))
 
-def create_scattermapbox_filtered(list_data):
-    figure = go.Figure()
 
+def create_scattermapbox_filtered(list_data, statistics):
+    scattermapboxes = []
     for data_tuple in list_data:
-        data_plot = get_start_count_month(data_tuple[2])
-        scattermapbox = go.Scattermapbox(
-            lat=data_plot['Latitude'], lon=data_plot['Longitude'],
+        data_plot = data_tuple[2]
+        scattermapbox = dict(
+            type='scattermapbox',
+            lat=to_array(data_plot['Latitude']), lon=to_array(data_plot['Longitude']),
             mode='markers',
-            marker=go.scattermapbox.Marker(
-                size=data_plot['Trip Count'],
+            marker=dict(
+                size=to_array(data_plot['Trip Count']),
                 opacity=0.7,
                 sizemode='area',
                 sizeref=data_plot['Trip Count'].max() / 50 ** 2,
                 color=colormap[data_tuple[0]]
             ),
-            text=data_plot['Name'],
+            text=to_array(data_plot['Name']),
             hoverinfo='text',
             showlegend=True,
             name=data_tuple[1],
         )
+        scattermapboxes.append(scattermapbox)
+
+    return build_figure(scattermapboxes, create_layout_mapbox(statistics))
+
+
+def create_cube_data(cube, statistics):
+    """
+    Creates the data of the page for the filters in the browser: the stations with trips, their counts per user type
+    and gender, the labels and colors and the layout of the map.
+    :param cube: The station cube, of the trips within the time window if one is selected.
+    :return: The data as dict, the counts as flat list (station, user type, gender).
+    """
+    station_totals = cube.counts.sum(axis=(1, 2))
+    plotted = np.flatnonzero(station_totals)
+    stations = cube.dimension.get_attributes(plotted)
+    return dict(
+        name=to_array(stations['Name']),
+        lat=to_array(stations['Latitude']),
+        lon=to_array(stations['Longitude']),
+        user_types=cube.user_types,
+        genders=cube.genders,
+        counts=to_array(cube.counts[plotted].ravel()),
+        labels=i18n,
+        colors=colormap,
+        layout=build_figure([], create_layout_mapbox(statistics))['layout'],
+        trip_count=statistics.trip_count,
+        station_count=statistics.station_count,
+        shown_trip_count=int(station_totals.sum()),
+        shown_station_count=len(plotted),
+    )
 
-        _ = figure.add_trace(scattermapbox)
 
-    _ = figure.update_layout(
-        margin={'r': 0, 't': 30, 'l': 0, 'b': 0},
-        mapbox=dict(
-            style='open-street-map',
-            center=dict(
-                lat=center_lat,
-                lon=center_lon
-            ),
-            pitch=0,
-            zoom=12
-        ),
-        width=1200, height=1600
-    )
+def create_filter_outputs(user_types, genders, month, time_window=None, weather=None):
+    cube = get_filtered_cube(month, time_window, weather)
+    statistics = get_trip_statistics(month)
+    if len(user_types) == 0 and len(genders) == 0:
+        fig = create_scattermapbox(cube, statistics)
+        station_totals = cube.counts.sum(axis=(1, 2))
+        trip_stats = get_trip_stats(None, statistics, int(station_totals.sum()))
+        station_stats = get_station_stats(None, statistics, int(np.count_nonzero(station_totals)))
+        return fig, station_stats, trip_stats
+    else:
+        filtered_data = filter_data(cube, user_types, genders)
+        fig = create_scattermapbox_filtered(filtered_data, statistics)
 
-    return figure
-
-
-layout = dbc.Row(
-    [
-        dbc.Col(
-            [
-                html.Div(create_sidepanel()),
-                html.Div(
-                    [
-                        html.Div(id='tc2-scattermapbox-fig-output'),
-                        html.Div(id='tc2-scattermapbox-fig-selected-output'),
-                        html.Div(id='tc2-scattermapbox-fig-hover-output'),
-                    ],
-                    hidden=True
-                ),
-
-                html.Div(
-                    [
-                        html.Div(id='tc2-dropdown-user-type-output'),
-                        html.Div(id='tc2-dropdown-gender-output'),
-                    ]
-                )
-
-            ],
-            md=4
-        ),
-        dbc.Col(
-            [
-                html.Div(
-                    dcc.Graph(
-                        id='tc2-scattermapbox-fig',
-                        figure=create_scattermapbox(df_month),
-                        style={'width': '100%', 'height': '80vh', 'margin': "auto", "display": "block"},
-                        responsive=True
+        station_stats = get_station_stats(filtered_data, statistics)
+        trip_stats = get_trip_stats(filtered_data, statistics)
+
+        return fig, station_stats, trip_stats
+
+
+def create_layout():
+    """
+    Creates the layout from the current version of the data (see data.start_reloader).
+    """
+    cube = get_station_cube()
+    statistics = get_trip_statistics()
+    return dbc.Row(
+        [
+            dbc.Col(
+                [
+                    html.Div(create_sidepanel(statistics)),
+                    html.Div(
+                        [
+                            html.Div(id='tc2-scattermapbox-fig-output'),
+                            html.Div(id='tc2-scattermapbox-fig-selected-output'),
+                            html.Div(id='tc2-scattermapbox-fig-hover-output'),
+                        ],
+                        hidden=True
+                    ),
+
+                    html.Div(
+                        [
+                            html.Div(id='tc2-dropdown-user-type-output'),
+                            html.Div(id='tc2-dropdown-gender-output'),
+                        ]
+                    ),
+                    dcc.Store(
+                        id='tc2-store-cube',
+                        data=create_cube_data(cube, statistics) if clientside_filter else None
                     )
-                ),
-            ],
-            md=8
-        ),
-    ]
-)
+
+                ],
+                md=4
+            ),
+            dbc.Col(
+                [
+                    html.Div(
+                        dcc.Graph(
+                            id='tc2-scattermapbox-fig',
+                            figure=create_scattermapbox(cube, statistics),
+                            style={'width': '100%', 'height': '80vh', 'margin': "auto", "display": "block"},
+                            responsive=True
+                        )
+                    ),
+                ],
+                md=8
+            ),
+        ]
+    )
 
 
 def register_callbacks(app):
+    time_filter.register_callbacks(app, 'tc2')
+
     @app.callback(
         Output('tc2-scattermapbox-fig-output', 'children'),
         [Input('tc2-scattermapbox-fig', 'clickData')]
@@ -365,24 +394,60 @@ def register_callbacks(app):
     def callback_scattermapbox_fig_hover(hover_data):
         return 'hover_data: {}'.format(hover_data)
 
+    if clientside_filter:
+        @app.callback(
+            Output('tc2-store-cube', 'data'),
+            [Input('tc2-dropdown-month', 'value'),
+             Input('tc2-slider-days', 'value'),
+             Input('tc2-slider-hours', 'value'),
+             Input('tc2-dropdown-weekday', 'value'),
+             Input('tc2-dropdown-weather', 'value'),
+             Input('tc2-slider-temperature', 'value'),
+             Input('tc2-slider-wind-speed', 'value')]
+        )
+        def callback_month(month_value, days_value, hours_value, weekday_value, weather_value, temperature_value,
+                           wind_speed_value):
+            # the time window and the weather are selected on the server, their counts are filtered in the browser
+            weather = get_weather(weather_value, temperature_value, wind_speed_value)
+            with snapshot('stations', month_value):
+                time_window = get_time_window(month_value, days_value, hours_value, weekday_value)
+                return create_cube_data(get_filtered_cube(month_value, time_window, weather),
+                                        get_trip_statistics(month_value))
+
+        app.clientside_callback(
+            ClientsideFunction(namespace='tripCountV2', function_name='filter'),
+            [Output('tc2-scattermapbox-fig', 'figure'),
+             Output('tc2-numbers-station-stats-output', 'children'),
+             Output('tc2-numbers-trip-stats-output', 'children')],
+            [Input('tc2-dropdown-user-type', 'value'),
+             Input('tc2-dropdown-gender', 'value'),
+             Input('tc2-store-cube', 'data')]
+        )
+        return
+
     @app.callback(
         [Output('tc2-scattermapbox-fig', 'figure'),
          Output('tc2-numbers-station-stats-output', 'children'),
          Output('tc2-numbers-trip-stats-output', 'children')],
         [Input('tc2-dropdown-user-type', 'value'),
-         Input('tc2-dropdown-gender', 'value')]
+         Input('tc2-dropdown-gender', 'value'),
+         Input('tc2-dropdown-month', 'value'),
+         Input('tc2-slider-days', 'value'),
+         Input('tc2-slider-hours', 'value'),
+         Input('tc2-dropdown-weekday', 'value'),
+         Input('tc2-dropdown-weather', 'value'),
+         Input('tc2-slider-temperature', 'value'),
+         Input('tc2-slider-wind-speed', 'value')]
     )
-    def callback_filter(user_type_value, gender_value):
-        if (user_type_value is None or len(user_type_value) == 0) and (gender_value is None or len(gender_value) == 0):
-            fig = create_scattermapbox(df_month)
-            trip_stats = get_trip_stats(get_start_count_month(df_month))
-            station_stats = get_station_stats(get_start_count_month(df_month))
-            return fig, station_stats, trip_stats
-        else:
-            filtered_data = filter_data(df_month, user_type_value, gender_value)
-            fig = create_scattermapbox_filtered(filtered_data)
-
-            station_stats = get_station_stats(filtered_data)
-            trip_stats = get_trip_stats(filtered_data)
-
-            return fig, station_stats, trip_stats
+    def callback_filter(user_type_value, gender_value, month_value, days_value, hours_value, weekday_value,
+                        weather_value, temperature_value, wind_speed_value):
+        # the same selection in another order gives the same outputs, most callbacks are answered from the cache
+        user_types = normalize_selection(user_type_value)
+        genders = normalize_selection(gender_value)
+        weather = get_weather(weather_value, temperature_value, wind_speed_value)
+        # the outputs are created from one version of the data, also if it is reloaded in the meantime
+        with snapshot('stations', month_value) as version:
+            time_window = get_time_window(month_value, days_value, hours_value, weekday_value)
+            key = (user_types, genders, month_value, time_window, weather, version)
+            return filter_outputs_cache.get(key, lambda: create_filter_outputs(user_types, genders, month_value,
+                                                                               time_window, weather))
@@ -3,22 +3,22 @@ import typing
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
-import pandas as pd
+import numpy as np
 import plotly.express as px
-import plotly.graph_objects as go
-from dash.dependencies import Output, Input
-
-from data import read_df_month
+from dash.dependencies import Output, Input, State
+from dash.exceptions import PreventUpdate
+
+import time_filter
+from aggregation import bin_station_counts, duration_bins, get_degrees_per_pixel, get_filtered_cube, \
+    get_station_cube, get_station_dimension, get_station_grid, get_trip_profile, get_trip_statistics, select_bounds
+from data import get_default_month, get_month_options, get_source_description, snapshot
+from figures import build_figure, to_array
+from output_cache import OutputCache, normalize_selection
+from time_filter import create_time_filter, get_time_window
+from weather_filter import create_weather_filter, get_weather
 
 # Prefix for IDs: tc3
 
-df_month = read_df_month()
-
-center_lat = (df_month['Start Station Latitude'].max() - df_month['Start Station Latitude'].min()) / 2 + df_month[
-    'Start Station Latitude'].min()
-center_lon = (df_month['Start Station Longitude'].max() - df_month['Start Station Longitude'].min()) / 2 + df_month[
-    'Start Station Longitude'].min()
-
 i18n = {
     '0': 'Unbekannt',
     '1': 'männlich',
@@ -41,107 +41,92 @@ colormap = {
     'Customer-2': px.colors.sequential.Plotly3[10],
 }
 
+# outputs of callback_filter,
+# (user types, genders, month, view, time window, weather, data version) -> (figure, station stats, trip stats)
+filter_outputs_cache = OutputCache()
 
-def get_start_count_month(data):
-    df_start_count_month = pd.pivot_table(
-        data,
-        index=['Start Station Name', 'Start Station Latitude', 'Start Station Longitude'],
-        values=['Trip Duration'],
-        aggfunc='count'
-    )
+# outputs of callback_station_details, (station ID, month, data version) -> children of the card "Station"
+station_details_cache = OutputCache()
 
-    df_start_count_month = df_start_count_month.reset_index().rename(columns={
-        'Start Station Name': 'Name',
-        'Start Station Latitude': 'Latitude',
-        'Start Station Longitude': 'Longitude',
-        'Trip Duration': 'Trip Count'
-    })
+# outputs of callback_selection_stats,
+# (selection, month, time window, weather, data version) -> children of the card "Auswahl"
+selection_stats_cache = OutputCache()
 
-    return df_start_count_month
+# size of the map in pixels (see create_layout_mapbox) and its initial zoom level, below this zoom level the stations
+# close to each other are combined to one marker
+map_width = 1200
+map_height = 1600
+map_zoom = 12
 
 
-def filter_data(data, user_types, genders):
-    df_result = []
+def filter_data(cube, user_types, genders):
+    # all combinations are counted at once from the cube, the station attributes are joined only once
+    combinations, counts = cube.get_partition_counts(user_types, genders)
+    plotted = np.flatnonzero(counts.any(axis=1))
+    stations = cube.dimension.get_attributes(plotted)
+    counts = counts[plotted]
+    trip_counts = counts.sum(axis=0)
+    station_counts = np.count_nonzero(counts, axis=0)
 
-    if user_types is not None and len(user_types) > 0:
-        for user_type in user_types:
-            if genders is not None and len(genders) > 0:
-                for gender in genders:
-                    df_filtered = data[(data['User Type'] == user_type) & (data['Gender'] == gender)]
-                    df_result.append(
-                        (
-                            '{}-{}'.format(user_type, gender),
-                            '{} & {}'.format(i18n[user_type], i18n[gender]),
-                            df_filtered
-                        )
-                    )
-            else:
-                df_filtered = data[data['User Type'] == user_type]
-                df_result.append(
-                    (
-                        '{}'.format(user_type),
-                        '{}'.format(i18n[user_type]),
-                        df_filtered
-                    )
-                )
-    else:
-        if genders is not None and len(genders) > 0:
-            for gender in genders:
-                df_filtered = data[data['Gender'] == gender]
-                df_result.append(
-                    (
-                        '{}'.format(gender),
-                        '{}'.format(i18n[gender]),
-                        df_filtered
-                    )
-                )
+    df_result = []
+    for i, combination in enumerate(combinations):
+        values = [value for value in combination if value is not None]
+        df_result.append(
+            (
+                '-'.join(values),
+                ' & '.join(i18n[value] for value in values),
+                stations.assign(**{'Trip Count': counts[:, i]})[counts[:, i] > 0].reset_index(drop=True),
+                int(trip_counts[i]),
+                int(station_counts[i])
+            )
+        )
 
     return df_result
 
 
-def get_trip_stats(data):
-    total = get_start_count_month(df_month)['Trip Count'].sum()
+def get_trip_stats(data, statistics, shown=None):
+    # shown: the number of trips without filter (within the time window), None for all trips
+    total = statistics.trip_count
     if isinstance(data, typing.List):
         # filtered statistics, show numbers of each filter
         stats = 'Gesamt: **{:,d}**  \n'.format(total)
         for data_entry in data:
-            trip_sum = get_start_count_month(data_entry[2])['Trip Count'].sum()
+            trip_sum = data_entry[3]
             stats = stats + data_entry[1] + ': **{:,d}**  \n'.format(trip_sum) + '  '
         return stats
     else:
-        # no filter active, normal dataset given
-        actual_showing = data['Trip Count'].sum()
+        # no filter active, all trips are shown
         stats = '''
             Gesamt: **{:,d}**  
             Aktuell angezeigt: **{:,d}**
-            '''.format(total, actual_showing)
+            '''.format(total, total if shown is None else shown)
         return stats
 
 
-def get_station_stats(data):
-    total = get_start_count_month(df_month)['Trip Count'].count()
+def get_station_stats(data, statistics, shown=None):
+    # shown: the number of stations without filter (within the time window), None for all stations
+    total = statistics.station_count
     if isinstance(data, typing.List):
         # filtered statistics, show numbers of each filter
         stats = 'Gesamt: **{:,d}**  \n'.format(total)
         for data_entry in data:
-            station_count = get_start_count_month(data_entry[2])['Trip Count'].count()
+            station_count = data_entry[4]
             stats = stats + data_entry[1] + ': **{:,d}**  \n'.format(station_count) + '  '
         return stats
     else:
-        # no filter active, normal dataset given
-        actual_showing = data['Trip Count'].count()
+        # no filter active, all trips are shown
         stats = '''
             Gesamt: **{:,d}**  
             Aktuell angezeigt: **{:,d}**
-            '''.format(total, actual_showing)
+            '''.format(total, total if shown is None else shown)
         return stats
 
 
-def create_sidepanel():
+def create_sidepanel(statistics):
     sidepanel = html.Div(
         [
             html.H4(['Nutzung Stationen', html.Small(' (Version 3)', className='text-muted')]),
-            dcc.Markdown('_Datengrundlage_: **5000 zufällige Stichproben aus dem Monat Oktober 2019**'),
+            dcc.Markdown('_Datengrundlage_: **{}**'.format(get_source_description())),
             dcc.Markdown('''
             **Fehler Version 2**
             
@@ -158,6 +143,10 @@ def create_sidepanel():
             ermittelt.
             * Die Grösse des Symbols in der Legende wurde auf ```constant``` gesetzt, dadurch ist es egal wie klein/gross 
             die Kreise auf der Karte sind, das Symbol in der Legende wird immer gleich gross angezeigt.
+            * Ein Klick auf eine Station zeigt unter _Station_ ihre Fahrten nach Uhrzeit, Benutzerart und Geschlecht,
+            Fahrtdauer und die häufigsten Ziele an.
+            * Werden mit der Box- oder Lasso-Auswahl der Karte mehrere Stationen ausgewählt, zeigt _Auswahl_ ihre Fahrten
+            zusammen und die Stationen mit den meisten Fahrten an.
             
             **Nächste Optimierungen**
             
@@ -170,6 +159,14 @@ def create_sidepanel():
                     dbc.CardHeader('Filterauswahl'),
                     dbc.CardBody(
                         [
+                            html.H5('Monat', className='card-title'),
+                            dcc.Dropdown(
+                                id='tc3-dropdown-month',
+                                options=get_month_options(),
+                                value=get_default_month(),
+                                clearable=False,
+                                className='mb-3'
+                            ),
                             html.H5('Benutzerart', className='card-title'),
                             dcc.Dropdown(
                                 id='tc3-dropdown-user-type',
@@ -188,8 +185,11 @@ def create_sidepanel():
                                     dict(label=i18n['1'], value='1'),
                                     dict(label=i18n['2'], value='2')
                                 ],
-                                multi=True
+                                multi=True,
+                                className='mb-3'
                             ),
+                            *create_time_filter('tc3'),
+                            *create_weather_filter('tc3'),
                         ]
                     )
                 ],
@@ -202,16 +202,38 @@ def create_sidepanel():
                     dbc.CardBody(
                         [
                             html.H5('Fahrten', className='card-title'),
-                            dcc.Markdown(get_trip_stats(get_start_count_month(df_month)),
+                            dcc.Markdown(get_trip_stats(None, statistics),
                                          id='tc3-numbers-trip-stats-output'),
                             html.Hr(),
                             html.H5('Stationen', className='card-title'),
-                            dcc.Markdown(get_station_stats(get_start_count_month(df_month)),
+                            dcc.Markdown(get_station_stats(None, statistics),
                                          id='tc3-numbers-station-stats-output'),
                         ]
                     )
                 ],
                 className='mb-3'
+            ),
+
+            dbc.Card(
+                [
+                    dbc.CardHeader('Auswahl'),
+                    dbc.CardBody(
+                        create_selection_stats(None, None),
+                        id='tc3-selection-stats-output'
+                    )
+                ],
+                className='mb-3'
+            ),
+
+            dbc.Card(
+                [
+                    dbc.CardHeader('Station'),
+                    dbc.CardBody(
+                        create_station_details(None, None),
+                        id='tc3-station-details-output'
+                    )
+                ],
+                className='mb-3'
             )
 
         ]
@@ -220,158 +242,410 @@ def create_sidepanel():
     return sidepanel
 
 
-def create_scattermapbox(data):
-    figure = go.Figure()
+def create_layout_mapbox(statistics):
+    return dict(
+        margin={'r': 0, 't': 30, 'l': 0, 'b': 0},
+        mapbox=dict(
+            style='open-street-map',
+            center=dict(
+                lat=statistics.center_lat,
+                lon=statistics.center_lon
+            ),
+            pitch=0,
+            zoom=map_zoom
+        ),
+        width=map_width, height=map_height,
+        legend=dict(
+            itemsizing='constant',
+        ),
+        # keeps zoom and position of the user when the figure is replaced
+        uirevision='tc3'
+    )
 
-    data_plot = get_start_count_month(data)
 
-    scattermapbox = go.Scattermapbox(
-        lat=data_plot['Latitude'], lon=data_plot['Longitude'],
+def get_map_view(relayout_data):
+    """
+    Reduces the relayout data of the map to the view the markers depend on. Below map_zoom only the zoom level (floor)
+    matters, the stations are binned. From map_zoom on the stations within the visible bounds are shown, the bounds
+    are widened to a grid of half the map size, so small moves of the map give the same view.
+    :param relayout_data: The relayoutData of the map.
+    :return: (zoom level, None) or (zoom level, (south, north, west, east)), None if the zoom is not known.
+    """
+    if relayout_data is None or 'mapbox.zoom' not in relayout_data:
+        return None
+    zoom = relayout_data['mapbox.zoom']
+    zoom_level = int(np.floor(zoom))
+    if zoom < map_zoom:
+        return zoom_level, None
+
+    derived = relayout_data.get('mapbox._derived')
+    if derived is not None and 'coordinates' in derived:
+        coordinates = np.array(derived['coordinates'])
+        west, east = coordinates[:, 0].min(), coordinates[:, 0].max()
+        south, north = coordinates[:, 1].min(), coordinates[:, 1].max()
+    else:
+        center = relayout_data.get('mapbox.center', {})
+        if 'lat' not in center or 'lon' not in center:
+            return zoom_level, None
+        degrees_per_pixel = get_degrees_per_pixel(zoom)
+        half_lon = map_width / 2 * degrees_per_pixel
+        half_lat = map_height / 2 * degrees_per_pixel * np.cos(np.radians(center['lat']))
+        west, east = center['lon'] - half_lon, center['lon'] + half_lon
+        south, north = center['lat'] - half_lat, center['lat'] + half_lat
+
+    step_lon = map_width / 2 * get_degrees_per_pixel(zoom_level)
+    step_lat = map_height / 2 * get_degrees_per_pixel(zoom_level) * np.cos(np.radians((south + north) / 2))
+    bounds = (
+        float(np.floor(south / step_lat) * step_lat), float(np.ceil(north / step_lat) * step_lat),
+        float(np.floor(west / step_lon) * step_lon), float(np.ceil(east / step_lon) * step_lon),
+    )
+    return zoom_level, tuple(round(value, 6) for value in bounds)
+
+
+def get_max_trip_count(data):
+    # at least 1, also the scale of a map without trips is valid
+    return max(int(data['Trip Count'].max()), 1) if len(data) > 0 else 1
+
+
+def reduce_detail(data, view):
+    """
+    :param data: The station counts to plot.
+    :param view: The view of the map, see get_map_view.
+    :return: The stations binned below map_zoom or within the bounds of the view, all stations if the view is None, and
+    the largest trip count of the markers of the whole map at the zoom level of the view. The markers are scaled to it
+    instead of the visible markers, so a station keeps the size and color of its marker when the map is moved.
+    """
+    if view is None:
+        return data, get_max_trip_count(data)
+    zoom_level, bounds = view
+    if zoom_level < map_zoom:
+        # the grid cells do not depend on the bounds, the cells of the whole map are binned
+        data_binned = bin_station_counts(data, zoom_level)
+        return data_binned, get_max_trip_count(data_binned)
+    if bounds is not None:
+        return select_bounds(data, bounds), get_max_trip_count(data)
+    return data, get_max_trip_count(data)
+
+
+def create_scattermapbox(cube, statistics, view=None):
+    # figures as plain dicts, see figures.py
+    data_plot, max_trip_count = reduce_detail(cube.get_station_counts(), view)
+
+    scattermapbox = dict(
+        type='scattermapbox',
+        lat=to_array(data_plot['Latitude']), lon=to_array(data_plot['Longitude']),
         mode='markers',
-        marker=go.scattermapbox.Marker(
-            size=data_plot['Trip Count'],
-            color=data_plot['Trip Count'],
+        marker=dict(
+            size=to_array(data_plot['Trip Count']),
+            color=to_array(data_plot['Trip Count']),
+            cmin=0,
+            cmax=max_trip_count,
             opacity=0.7,
             showscale=True,
             sizemode='area',
-            sizeref=data_plot['Trip Count'].max() / 50 ** 2,
+            sizeref=max_trip_count / 50 ** 2,
             colorbar=dict(
-                title='Anzahl Fahrten',
+                title=dict(text='Anzahl Fahrten'),
                 tickformat='.%2f'
             )
         ),
-        text=data_plot['Name'],
+        text=to_array(data_plot['Name']),
+        customdata=to_array(data_plot['Station ID']),
         hoverinfo='text',
     )
 
-    _ = figure.add_trace(scattermapbox)
-
-    _ = figure.update_layout(
-        margin={'r': 0, 't': 30, 'l': 0, 'b': 0},
-        mapbox=dict(
-            style='open-street-map',
-            center=dict(
-                lat=center_lat,
-                lon=center_lon
-            ),
-            pitch=0,
-            zoom=12
-        ),
-        width=1200, height=1600,
-        legend=dict(
-            itemsizing='constant',
-        )
-    )
-
-    return figure
+    return build_figure([scattermapbox], create_layout_mapbox(statistics))
 
 
-def create_scattermapbox_filtered(list_data):
-    figure = go.Figure()
-
+def create_scattermapbox_filtered(list_data, statistics, view=None):
     data = {}
     max_trip_count = 0
     for data_tuple in list_data:
-        data[data_tuple[1]] = get_start_count_month(data_tuple[2])
-        actual_max_trip_count = data[data_tuple[1]]['Trip Count'].max()
+        data[data_tuple[0]], actual_max_trip_count = reduce_detail(data_tuple[2], view)
         if actual_max_trip_count > max_trip_count:
             max_trip_count = actual_max_trip_count
 
+    scattermapboxes = []
     for data_tuple in list_data:
-        data_plot = data[data_tuple[1]]
-        scattermapbox = go.Scattermapbox(
-            lat=data_plot['Latitude'], lon=data_plot['Longitude'],
+        data_plot = data[data_tuple[0]]
+        scattermapbox = dict(
+            type='scattermapbox',
+            lat=to_array(data_plot['Latitude']), lon=to_array(data_plot['Longitude']),
             mode='markers',
-            marker=go.scattermapbox.Marker(
-                size=data_plot['Trip Count'],
+            marker=dict(
+                size=to_array(data_plot['Trip Count']),
                 opacity=0.7,
                 sizemode='area',
                 sizeref=max_trip_count / 50 ** 2,
                 color=colormap[data_tuple[0]]
             ),
-            text=data_plot['Name'],
+            text=to_array(data_plot['Name']),
+            customdata=to_array(data_plot['Station ID']),
             hoverinfo='text',
             showlegend=True,
             name=data_tuple[1],
         )
+        scattermapboxes.append(scattermapbox)
+
+    return build_figure(scattermapboxes, create_layout_mapbox(statistics))
+
+
+def get_station_id(click_data):
+    """
+    :param click_data: The clickData of the map.
+    :return: The ID of the clicked station, -1 for a marker of several stations, None if no marker was clicked.
+    """
+    if click_data is None or len(click_data.get('points', [])) == 0:
+        return None
+    station_id = click_data['points'][0].get('customdata')
+    return -1 if station_id is None or station_id != station_id else int(station_id)
+
+
+def create_bar_figure(x, y, x_title):
+    return build_figure(
+        [dict(type='bar', x=x, y=y, marker=dict(color=px.colors.sequential.OrRd[5]), hoverinfo='x+y')],
+        dict(
+            margin={'r': 0, 't': 10, 'l': 40, 'b': 40},
+            height=200,
+            xaxis=dict(title=dict(text=x_title), type='category'),
+            yaxis=dict(title=dict(text='Fahrten')),
+        )
+    )
 
-        _ = figure.add_trace(scattermapbox)
 
-    _ = figure.update_layout(
-        margin={'r': 0, 't': 30, 'l': 0, 'b': 0},
-        mapbox=dict(
-            style='open-street-map',
-            center=dict(
-                lat=center_lat,
-                lon=center_lon
-            ),
-            pitch=0,
-            zoom=12
-        ),
-        width=1200, height=1600,
-        legend=dict(
-            itemsizing='constant',
-        )
+def create_station_details(station_id, month):
+    """
+    Creates the drill-down of a station from its trips only, see aggregation.StationRowIndex.
+    :param station_id: The ID of the station, see get_station_id.
+    :param month: The month (YYYY-MM), None for the latest available month.
+    :return: The children of the card "Station".
+    """
+    if station_id is None:
+        return [dcc.Markdown('Für Details auf eine Station in der Karte klicken.')]
+    if station_id < 0:
+        return [dcc.Markdown('Der Kreis fasst mehrere Stationen zusammen, für Details in die Karte hineinzoomen.')]
+
+    dimension = get_station_dimension(month)
+    code = dimension.get_codes([station_id])[0]
+    profile = get_trip_profile(month, [station_id])
+    if code < 0 or profile.trip_count == 0:
+        return [dcc.Markdown('Im ausgewählten Monat sind keine Fahrten von dieser Station aus gestartet.')]
+
+    user_type_gender_stats = ''.join(
+        '{}: **{:,d}**  \n'.format(i18n.get(value, value), int(count)) for value, count in
+        list(zip(profile.user_types, profile.user_type_gender_counts.sum(axis=1))) +
+        list(zip(profile.genders, profile.user_type_gender_counts.sum(axis=0)))
+    )
+    destinations = ''.join(
+        '{}. {}: **{:,d}**  \n'.format(i + 1, name, int(count)) for i, (name, count) in
+        enumerate(zip(profile.end_stations['Name'].head(5), profile.end_stations['Trip Count'].head(5)))
     )
+    duration_labels = ['{}-{}'.format(low, high) for low, high in zip(duration_bins, duration_bins[1:])] + \
+                      ['>{}'.format(duration_bins[-1])]
+
+    return [
+        html.H5(dimension.stations['Name'].iloc[code], className='card-title'),
+        dcc.Markdown('Fahrten im ausgewählten Monat: **{:,d}**  \n'.format(profile.trip_count) +
+                     user_type_gender_stats),
+        html.Hr(),
+        html.H5('Fahrten nach Uhrzeit', className='card-title'),
+        dcc.Graph(figure=create_bar_figure(list(range(24)), to_array(profile.hour_counts), 'Stunde'),
+                  config=dict(displayModeBar=False)),
+        html.Hr(),
+        html.H5('Häufigste Ziele', className='card-title'),
+        dcc.Markdown(destinations),
+        html.Hr(),
+        html.H5('Fahrtdauer', className='card-title'),
+        dcc.Graph(figure=create_bar_figure(duration_labels, to_array(profile.duration_counts), 'Minuten'),
+                  config=dict(displayModeBar=False)),
+    ]
 
-    return figure
-
-
-layout = dbc.Row(
-    [
-        dbc.Col(
-            [
-                html.Div(create_sidepanel()),
-                html.Div(
-                    [
-                        html.Div(id='tc3-scattermapbox-fig-output'),
-                        html.Div(id='tc3-scattermapbox-fig-selected-output'),
-                        html.Div(id='tc3-scattermapbox-fig-hover-output'),
-                    ],
-                    hidden=True
-                ),
-
-                html.Div(
-                    [
-                        html.Div(id='tc3-dropdown-user-type-output'),
-                        html.Div(id='tc3-dropdown-gender-output'),
-                    ]
-                )
-
-            ],
-            md=4
-        ),
-        dbc.Col(
-            [
-                html.Div(
-                    dcc.Graph(
-                        id='tc3-scattermapbox-fig',
-                        figure=create_scattermapbox(df_month),
-                        style={'width': '100%', 'height': '80vh', 'margin': "auto", "display": "block"},
-                        responsive=True
-                    )
-                ),
-            ],
-            md=8
-        ),
+
+def get_selection(selected_data):
+    """
+    :param selected_data: The selectedData of the map.
+    :return: ('box', (south, north, west, east)) or ('lasso', ((longitude, latitude), ...)), None if nothing is
+    selected.
+    """
+    if selected_data is None:
+        return None
+    if 'mapbox' in selected_data.get('lassoPoints', {}):
+        return 'lasso', tuple((round(lon, 6), round(lat, 6)) for lon, lat in selected_data['lassoPoints']['mapbox'])
+    if 'mapbox' in selected_data.get('range', {}):
+        (lon_1, lat_1), (lon_2, lat_2) = selected_data['range']['mapbox']
+        return 'box', tuple(round(value, 6) for value in (min(lat_1, lat_2), max(lat_1, lat_2),
+                                                          min(lon_1, lon_2), max(lon_1, lon_2)))
+    return None
+
+
+def create_selection_stats(selection, month, time_window=None, weather=None):
+    """
+    Creates the numbers of the stations within a selection of the map, the stations are found with the grid index
+    (see aggregation.StationGrid) and counted from the station cube.
+    :param selection: The selection, see get_selection.
+    :param month: The month (YYYY-MM), None for the latest available month.
+    :param time_window: The time window, see time_filter.get_time_window.
+    :param weather: The weather, see weather_filter.get_weather.
+    :return: The children of the card "Auswahl".
+    """
+    if selection is None:
+        return [dcc.Markdown('Für die Summe mehrerer Stationen diese mit der Box- oder Lasso-Auswahl der Karte '
+                             'auswählen.')]
+
+    kind, shape = selection
+    grid = get_station_grid(month)
+    codes = grid.select_box(shape) if kind == 'box' else grid.select_polygon(shape)
+    cube = get_filtered_cube(month, time_window, weather)
+    counts = cube.counts[codes]
+    station_totals = counts.sum(axis=(1, 2))
+    if station_totals.sum() == 0:
+        return [dcc.Markdown('In der Auswahl sind keine Fahrten gestartet.')]
+
+    stats = 'Stationen: **{:,d}**  \nFahrten: **{:,d}**  \n'.format(int(np.count_nonzero(station_totals)),
+                                                                   int(station_totals.sum()))
+    stats += ''.join(
+        '{}: **{:,d}**  \n'.format(i18n.get(value, value), int(count)) for value, count in
+        list(zip(cube.user_types, counts.sum(axis=(0, 2)))) + list(zip(cube.genders, counts.sum(axis=(0, 1))))
+    )
+    top = np.argsort(-station_totals, kind='stable')[:5]
+    top = top[station_totals[top] > 0]
+    stations = cube.dimension.get_attributes(codes[top])
+    top_stations = ''.join(
+        '{}. {}: **{:,d}**  \n'.format(i + 1, name, int(count)) for i, (name, count) in
+        enumerate(zip(stations['Name'], station_totals[top]))
+    )
+
+    return [
+        dcc.Markdown(stats),
+        html.Hr(),
+        html.H5('Stationen mit den meisten Fahrten', className='card-title'),
+        dcc.Markdown(top_stations),
     ]
-)
+
+
+def create_filter_outputs(user_types, genders, month, view=None, time_window=None, weather=None):
+    cube = get_filtered_cube(month, time_window, weather)
+    statistics = get_trip_statistics(month)
+    if len(user_types) == 0 and len(genders) == 0:
+        fig = create_scattermapbox(cube, statistics, view)
+        station_totals = cube.counts.sum(axis=(1, 2))
+        trip_stats = get_trip_stats(None, statistics, int(station_totals.sum()))
+        station_stats = get_station_stats(None, statistics, int(np.count_nonzero(station_totals)))
+        return fig, station_stats, trip_stats
+    else:
+        filtered_data = filter_data(cube, user_types, genders)
+        fig = create_scattermapbox_filtered(filtered_data, statistics, view)
+
+        station_stats = get_station_stats(filtered_data, statistics)
+        trip_stats = get_trip_stats(filtered_data, statistics)
+
+        return fig, station_stats, trip_stats
+
+
+def create_layout():
+    """
+    Creates the layout from the current version of the data (see data.start_reloader).
+    """
+    cube = get_station_cube()
+    statistics = get_trip_statistics()
+    return dbc.Row(
+        [
+            dbc.Col(
+                [
+                    html.Div(create_sidepanel(statistics)),
+                    html.Div(
+                        [
+                            html.Div(id='tc3-scattermapbox-fig-hover-output'),
+                        ],
+                        hidden=True
+                    ),
+
+                    html.Div(
+                        [
+                            html.Div(id='tc3-dropdown-user-type-output'),
+                            html.Div(id='tc3-dropdown-gender-output'),
+                        ]
+                    )
+
+                ],
+                md=4
+            ),
+            dbc.Col(
+                [
+                    html.Div(
+                        dcc.Graph(
+                            id='tc3-scattermapbox-fig',
+                            figure=create_scattermapbox(cube, statistics),
+                            style={'width': '100%', 'height': '80vh', 'margin': "auto", "display": "block"},
+                            responsive=True
+                        )
+                    ),
+                    # the view of the map (see get_map_view), only changed by a zoom or move of the map
+                    dcc.Store(id='tc3-store-view'),
+                ],
+                md=8
+            ),
+        ]
+    )
+
+
+def get_view(view_data):
+    # the view from the store, JSON has lists instead of tuples
+    if view_data is None:
+        return None
+    zoom_level, bounds = view_data
+    return zoom_level, tuple(bounds) if bounds is not None else None
 
 
 def register_callbacks(app):
+    time_filter.register_callbacks(app, 'tc3')
+
+    @app.callback(
+        Output('tc3-store-view', 'data'),
+        [Input('tc3-scattermapbox-fig', 'relayoutData')],
+        [State('tc3-store-view', 'data')]
+    )
+    def callback_view(relayout_data, view_data):
+        # relayouts not changing the map (e.g. {'dragmode': 'lasso'} or {'autosize': True}) keep the last view
+        if relayout_data is None or 'mapbox.zoom' not in relayout_data:
+            raise PreventUpdate
+        view = get_map_view(relayout_data)
+        if view == get_view(view_data):
+            raise PreventUpdate
+        return view
+
     @app.callback(
-        Output('tc3-scattermapbox-fig-output', 'children'),
-        [Input('tc3-scattermapbox-fig', 'clickData')]
+        Output('tc3-station-details-output', 'children'),
+        [Input('tc3-scattermapbox-fig', 'clickData'),
+         Input('tc3-dropdown-month', 'value')]
     )
-    def callback_scattermapbox_fig(click_data):
-        return 'click_data: {}'.format(click_data)
+    def callback_station_details(click_data, month_value):
+        station_id = get_station_id(click_data)
+        with snapshot('stations', month_value) as version:
+            key = (station_id, month_value, version)
+            return station_details_cache.get(key, lambda: create_station_details(station_id, month_value))
 
     @app.callback(
-        Output('tc3-scattermapbox-fig-selected-output', 'children'),
-        [Input('tc3-scattermapbox-fig', 'selectedData')]
+        Output('tc3-selection-stats-output', 'children'),
+        [Input('tc3-scattermapbox-fig', 'selectedData'),
+         Input('tc3-dropdown-month', 'value'),
+         Input('tc3-slider-days', 'value'),
+         Input('tc3-slider-hours', 'value'),
+         Input('tc3-dropdown-weekday', 'value'),
+         Input('tc3-dropdown-weather', 'value'),
+         Input('tc3-slider-temperature', 'value'),
+         Input('tc3-slider-wind-speed', 'value')]
     )
-    def callback_scattermapbox_fig(selected_data):
-        return 'selected-data: {}'.format(selected_data)
+    def callback_selection_stats(selected_data, month_value, days_value, hours_value, weekday_value, weather_value,
+                                 temperature_value, wind_speed_value):
+        # the numbers follow the time window and the weather of the map
+        selection = get_selection(selected_data)
+        weather = get_weather(weather_value, temperature_value, wind_speed_value)
+        with snapshot('stations', month_value) as version:
+            time_window = get_time_window(month_value, days_value, hours_value, weekday_value)
+            key = (selection, month_value, time_window, weather, version)
+            return selection_stats_cache.get(key, lambda: create_selection_stats(selection, month_value, time_window,
+                                                                                 weather))
 
     @app.callback(
         Output('tc3-scattermapbox-fig-hover-output', 'children'),
@@ -385,19 +659,26 @@ def register_callbacks(app):
          Output('tc3-numbers-station-stats-output', 'children'),
          Output('tc3-numbers-trip-stats-output', 'children')],
         [Input('tc3-dropdown-user-type', 'value'),
-         Input('tc3-dropdown-gender', 'value')]
+         Input('tc3-dropdown-gender', 'value'),
+         Input('tc3-dropdown-month', 'value'),
+         Input('tc3-store-view', 'data'),
+         Input('tc3-slider-days', 'value'),
+         Input('tc3-slider-hours', 'value'),
+         Input('tc3-dropdown-weekday', 'value'),
+         Input('tc3-dropdown-weather', 'value'),
+         Input('tc3-slider-temperature', 'value'),
+         Input('tc3-slider-wind-speed', 'value')]
     )
-    def callback_filter(user_type_value, gender_value):
-        if (user_type_value is None or len(user_type_value) == 0) and (gender_value is None or len(gender_value) == 0):
-            fig = create_scattermapbox(df_month)
-            trip_stats = get_trip_stats(get_start_count_month(df_month))
-            station_stats = get_station_stats(get_start_count_month(df_month))
-            return fig, station_stats, trip_stats
-        else:
-            filtered_data = filter_data(df_month, user_type_value, gender_value)
-            fig = create_scattermapbox_filtered(filtered_data)
-
-            station_stats = get_station_stats(filtered_data)
-            trip_stats = get_trip_stats(filtered_data)
-
-            return fig, station_stats, trip_stats
+    def callback_filter(user_type_value, gender_value, month_value, view_data, days_value, hours_value,
+                        weekday_value, weather_value, temperature_value, wind_speed_value):
+        # the same selection in another order gives the same outputs, most callbacks are answered from the cache
+        user_types = normalize_selection(user_type_value)
+        genders = normalize_selection(gender_value)
+        view = get_view(view_data)
+        weather = get_weather(weather_value, temperature_value, wind_speed_value)
+        # the outputs are created from one version of the data, also if it is reloaded in the meantime
+        with snapshot('stations', month_value) as version:
+            time_window = get_time_window(month_value, days_value, hours_value, weekday_value)
+            key = (user_types, genders, month_value, view, time_window, weather, version)
+            return filter_outputs_cache.get(key, lambda: create_filter_outputs(user_types, genders, month_value, view,
+                                                                               time_window, weather))
@@ -0,0 +1,122 @@
+/*
+ * Filters of the page "Nutzung Stationen (Version 2)" in the browser, see create_cube_data and
+ * create_filter_outputs in apps/tripCountV2/tripCountV2.py for the data and the outputs of the server.
+ */
+
+function tripCountV2FormatNumber(value) {
+    // same as '{:,d}'.format(value) in python
+    return value.toLocaleString('en-US');
+}
+
+function tripCountV2Counts(cube, userTypeIndexes, genderIndexes) {
+    var nUserTypes = cube.user_types.length;
+    var nGenders = cube.genders.length;
+    var counts = new Array(cube.name.length).fill(0);
+    for (var station = 0; station < counts.length; station++) {
+        for (var i = 0; i < userTypeIndexes.length; i++) {
+            for (var j = 0; j < genderIndexes.length; j++) {
+                counts[station] += cube.counts[(station * nUserTypes + userTypeIndexes[i]) * nGenders + genderIndexes[j]];
+            }
+        }
+    }
+    return counts;
+}
+
+function tripCountV2Trace(cube, counts) {
+    var trace = {type: 'scattermapbox', lat: [], lon: [], text: [], mode: 'markers', hoverinfo: 'text'};
+    var size = [];
+    for (var station = 0; station < counts.length; station++) {
+        if (counts[station] > 0) {
+            trace.lat.push(cube.lat[station]);
+            trace.lon.push(cube.lon[station]);
+            trace.text.push(cube.name[station]);
+            size.push(counts[station]);
+        }
+    }
+    trace.marker = {
+        size: size,
+        opacity: 0.7,
+        sizemode: 'area',
+        sizeref: size.length > 0 ? Math.max.apply(null, size) / Math.pow(50, 2) : 1
+    };
+    return trace;
+}
+
+function tripCountV2Indexes(categories, values) {
+    // the selected values in sorted order like normalize_selection, unknown values are ignored
+    return values.slice().sort().map(function (value) {
+        return categories.indexOf(value);
+    }).filter(function (index) {
+        return index >= 0;
+    });
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    tripCountV2: {
+        filter: function (userTypes, genders, cube) {
+            var allUserTypes = cube.user_types.map(function (value, index) {
+                return index;
+            });
+            var allGenders = cube.genders.map(function (value, index) {
+                return index;
+            });
+            var userTypeIndexes = tripCountV2Indexes(cube.user_types, userTypes || []);
+            var genderIndexes = tripCountV2Indexes(cube.genders, genders || []);
+
+            if (userTypeIndexes.length === 0 && genderIndexes.length === 0) {
+                var trace = tripCountV2Trace(cube, tripCountV2Counts(cube, allUserTypes, allGenders));
+                trace.marker.color = trace.marker.size;
+                trace.marker.showscale = true;
+                trace.marker.colorbar = {title: {text: 'Anzahl Fahrten'}, tickformat: '.%2f'};
+
+                var tripStats = '\n            Gesamt: **' + tripCountV2FormatNumber(cube.trip_count) + '**  \n' +
+                    '            Aktuell angezeigt: **' + tripCountV2FormatNumber(cube.shown_trip_count) + '**\n            ';
+                var stationStats = '\n            Gesamt: **' + tripCountV2FormatNumber(cube.station_count) + '**  \n' +
+                    '            Aktuell angezeigt: **' + tripCountV2FormatNumber(cube.shown_station_count) +
+                    '**\n            ';
+                return [{data: [trace], layout: cube.layout}, stationStats, tripStats];
+            }
+
+            // one trace per combination, a dimension without selection is not split
+            var combinations = [];
+            (userTypeIndexes.length > 0 ? userTypeIndexes : [null]).forEach(function (userTypeIndex) {
+                (genderIndexes.length > 0 ? genderIndexes : [null]).forEach(function (genderIndex) {
+                    combinations.push([userTypeIndex, genderIndex]);
+                });
+            });
+
+            var traces = [];
+            var filteredTripStats = 'Gesamt: **' + tripCountV2FormatNumber(cube.trip_count) + '**  \n';
+            var filteredStationStats = 'Gesamt: **' + tripCountV2FormatNumber(cube.station_count) + '**  \n';
+            combinations.forEach(function (combination) {
+                var values = [];
+                if (combination[0] !== null) {
+                    values.push(cube.user_types[combination[0]]);
+                }
+                if (combination[1] !== null) {
+                    values.push(cube.genders[combination[1]]);
+                }
+                var counts = tripCountV2Counts(
+                    cube,
+                    combination[0] !== null ? [combination[0]] : allUserTypes,
+                    combination[1] !== null ? [combination[1]] : allGenders
+                );
+                var trace = tripCountV2Trace(cube, counts);
+                trace.marker.color = cube.colors[values.join('-')];
+                trace.showlegend = true;
+                trace.name = values.map(function (value) {
+                    return cube.labels[value];
+                }).join(' & ');
+                traces.push(trace);
+
+                var tripCount = trace.marker.size.reduce(function (a, b) {
+                    return a + b;
+                }, 0);
+                filteredTripStats += trace.name + ': **' + tripCountV2FormatNumber(tripCount) + '**  \n  ';
+                filteredStationStats += trace.name + ': **' + tripCountV2FormatNumber(trace.lat.length) + '**  \n  ';
+            });
+
+            return [{data: traces, layout: cube.layout}, filteredStationStats, filteredTripStats];
+        }
+    }
+});
@@ -0,0 +1,90 @@
+"""
+Benchmark of the trip counts per start station: the former pivot_table of the tripCount pages against the integer code
+aggregation of aggregation.py. The trips are drawn (with replacement) from the trips of the default month.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_aggregation [--rows 5000 1000000 20000000] [--repeat 3]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from aggregation import StationDimension, encode_stations, count_stations, create_station_counts
+from data import get_dataset, to_plot_values
+
+
+def count_pivot_table(data):
+    # get_start_count_month before the aggregation engine
+    df_start_count_month = pd.pivot_table(
+        data,
+        index=['Start Station Name', 'Start Station Latitude', 'Start Station Longitude'],
+        values=['Trip Duration'],
+        aggfunc='count',
+        observed=True
+    ).sort_index()
+
+    df_start_count_month = df_start_count_month.reset_index().rename(columns={
+        'Start Station Name': 'Name',
+        'Start Station Latitude': 'Latitude',
+        'Start Station Longitude': 'Longitude',
+        'Trip Duration': 'Trip Count'
+    })
+    df_start_count_month['Latitude'] = to_plot_values(df_start_count_month['Latitude'])
+    df_start_count_month['Longitude'] = to_plot_values(df_start_count_month['Longitude'])
+    return df_start_count_month
+
+
+def create_trips(rows, seed=0):
+    df = get_dataset('stations')
+    positions = np.random.RandomState(seed).randint(0, len(df), size=rows)
+    return df.take(positions).reset_index(drop=True)
+
+
+def measure(function, repeat):
+    # best of the repetitions, the result of the last one is returned for the comparison
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(rows, repeat):
+    df = create_trips(rows)
+    mask = (df['User Type'] == 'Subscriber').to_numpy()
+
+    time_dimension, dimension = measure(lambda: StationDimension(df), 1)
+    time_encode, codes = measure(lambda: encode_stations(df, dimension, 'Start Station ID'), 1)
+
+    time_pivot, df_pivot = measure(lambda: count_pivot_table(df), repeat)
+    time_codes, df_codes = measure(lambda: create_station_counts(dimension, count_stations(codes, len(dimension.ids))),
+                                   repeat)
+    time_pivot_filtered, _ = measure(lambda: count_pivot_table(df[mask]), repeat)
+    time_codes_filtered, _ = measure(
+        lambda: create_station_counts(dimension, count_stations(codes, len(dimension.ids), mask)), repeat)
+
+    assert df_pivot['Trip Count'].sum() == df_codes['Trip Count'].sum()
+
+    return {
+        'rows': rows,
+        'pivot_table [ms]': time_pivot * 1000,
+        'codes [ms]': time_codes * 1000,
+        'speedup': time_pivot / time_codes,
+        'pivot_table filtered [ms]': time_pivot_filtered * 1000,
+        'codes filtered [ms]': time_codes_filtered * 1000,
+        'speedup filtered': time_pivot_filtered / time_codes_filtered,
+        'dimension + codes once [ms]': (time_dimension + time_encode) * 1000,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the trip counts per start station.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[5000, 1000000, 20000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = pd.DataFrame([run(rows, args.repeat) for rows in args.rows]).set_index('rows')
+    print(results.round(1).to_string())
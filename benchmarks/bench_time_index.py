@@ -0,0 +1,56 @@
+"""
+Benchmark of the time windows of the pages "Nutzung Stationen": a boolean scan of Start Time over all trips against the
+sorted Start Time index of aggregation.py. The trips are drawn (with replacement) from the trips of the default month.
+
+Run from the root of the repository:
+    python -m benchmarks.bench_time_index [--rows 5000 1000000 20000000] [--repeat 3]
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from aggregation import TimeIndex
+from benchmarks.bench_aggregation import create_trips, measure
+
+
+def scan(data, start, end, hours, weekdays):
+    # boolean mask over all trips, as the filters of the user types and genders
+    start_times = data['Start Time']
+    mask = ((start_times >= start) & (start_times < end)).to_numpy()
+    mask &= start_times.dt.hour.isin(hours).to_numpy()
+    mask &= start_times.dt.weekday.isin(weekdays).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def run(rows, repeat):
+    df = create_trips(rows)
+
+    time_index_once, time_index = measure(lambda: TimeIndex(df), 1)
+    windows = {
+        'one day': (time_index.get_day(14), time_index.get_day(15),
+                    tuple(range(24)), tuple(range(7))),
+        'one week, 7-9h': (time_index.get_day(7), time_index.get_day(14),
+                           (7, 8), tuple(range(7))),
+        'weekend': (time_index.first_day, time_index.get_day(time_index.day_count),
+                    tuple(range(24)), (5, 6)),
+    }
+
+    result = {'rows': rows, 'index once [ms]': time_index_once * 1000}
+    for name, window in windows.items():
+        time_scan, rows_scan = measure(lambda: scan(df, *window), repeat)
+        time_index_rows, rows_index = measure(lambda: time_index.get_rows(*window), repeat)
+        assert np.array_equal(rows_scan, np.sort(rows_index))
+        result['{} scan [ms]'.format(name)] = time_scan * 1000
+        result['{} index [ms]'.format(name)] = time_index_rows * 1000
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the time windows.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[5000, 1000000, 20000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = pd.DataFrame([run(rows, args.repeat) for rows in args.rows]).set_index('rows')
+    print(results.round(2).T.to_string())
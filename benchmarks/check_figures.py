@@ -0,0 +1,158 @@
+"""
+Checks that the figures built as plain dicts (see figures.py) give the same JSON as the former graph_objects
+construction, and compares the time to build them.
+
+Run from the root of the repository:
+    python -m benchmarks.check_figures [--repeat 20]
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import plotly
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from aggregation import get_station_cube, get_trip_statistics
+from apps.locationDistribution import locationDistribution
+from apps.tripCountV2 import tripCountV2
+from apps.tripCountV3 import tripCountV3
+from catalog import get_column_entry
+
+
+def create_scattermapbox_go(cube, statistics):
+    figure = go.Figure()
+    data_plot = cube.get_station_counts()
+    _ = figure.add_trace(go.Scattermapbox(
+        lat=data_plot['Latitude'], lon=data_plot['Longitude'],
+        mode='markers',
+        marker=go.scattermapbox.Marker(
+            size=data_plot['Trip Count'],
+            color=data_plot['Trip Count'],
+            opacity=0.7,
+            showscale=True,
+            sizemode='area',
+            sizeref=data_plot['Trip Count'].max() / 50 ** 2,
+            colorbar=dict(title='Anzahl Fahrten', tickformat='.%2f')
+        ),
+        text=data_plot['Name'],
+        hoverinfo='text',
+    ))
+    _ = figure.update_layout(**tripCountV2.create_layout_mapbox(statistics))
+    return figure
+
+
+def create_scattermapbox_filtered_go(list_data, statistics, layout, global_sizeref, customdata=False):
+    figure = go.Figure()
+    max_trip_count = max(data_tuple[2]['Trip Count'].max() for data_tuple in list_data)
+    for data_tuple in list_data:
+        data_plot = data_tuple[2]
+        _ = figure.add_trace(go.Scattermapbox(
+            lat=data_plot['Latitude'], lon=data_plot['Longitude'],
+            mode='markers',
+            marker=go.scattermapbox.Marker(
+                size=data_plot['Trip Count'],
+                opacity=0.7,
+                sizemode='area',
+                sizeref=(max_trip_count if global_sizeref else data_plot['Trip Count'].max()) / 50 ** 2,
+                color=tripCountV2.colormap[data_tuple[0]]
+            ),
+            text=data_plot['Name'],
+            customdata=data_plot['Station ID'] if customdata else None,
+            hoverinfo='text',
+            showlegend=True,
+            name=data_tuple[1],
+        ))
+    _ = figure.update_layout(**layout)
+    return figure
+
+
+def create_box_hist_go(column, hist_show, hist_yaxis_log, box_show, box_mean):
+    n_rows = (1 if hist_show else 0) + (1 if box_show else 0)
+    fig = make_subplots(rows=n_rows, cols=1, shared_xaxes=True, print_grid=False, vertical_spacing=0.05,
+                        y_title=column, row_heights=[0.5, 1] if hist_show and box_show else [1])
+    if box_show:
+        # the statistics are computed once per data version, see catalog.py
+        statistics = get_column_entry(column)['box']
+        color = plotly.colors.qualitative.Plotly[0]
+        _ = fig.add_trace(go.Box(
+            name='', orientation='h', y=[0],
+            q1=[statistics['q1']], median=[statistics['median']], q3=[statistics['q3']],
+            lowerfence=[statistics['lowerfence']], upperfence=[statistics['upperfence']],
+            mean=[statistics['mean']] if box_mean else None, boxmean=box_mean,
+            boxpoints=False, marker=dict(color=color)
+        ), 1, 1)
+        fig.update_yaxes(showticklabels=False, row=1)
+    if hist_show:
+        hist_row_number = (2 if box_show else 1)
+        # the bins are computed once per data version, see catalog.py
+        histogram = get_column_entry(column)['histogram']
+        edges, counts, size = np.asarray(histogram['edges']), histogram['counts'], histogram['size']
+        _ = fig.add_trace(go.Bar(
+            name='', x=np.round(edges + size / 2, 10), width=size,
+            y=[None if hist_yaxis_log and count == 0 else int(count) for count in counts],
+            hovertext=['{:g} - {:g}: {:,d}'.format(edge, edge + size, count) for edge, count in zip(edges, counts)],
+            hoverinfo='text'
+        ), hist_row_number, 1)
+        fig.update_yaxes(type='log' if hist_yaxis_log else 'linear', row=hist_row_number)
+    if box_show:
+        _ = fig.add_trace(go.Scatter(
+            name='', mode='markers', x=statistics['outliers'], y=[0] * len(statistics['outliers']),
+            marker=dict(color=color, size=6), hoverinfo='x'
+        ), 1, 1)
+    fig.update_layout(bargap=0, showlegend=False, margin={'r': 30, 't': 30, 'l': 60, 'b': 30})
+    return fig
+
+
+def to_json(figure):
+    return json.loads(json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def measure(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(repeat):
+    cube = get_station_cube()
+    statistics = get_trip_statistics()
+    list_data = tripCountV3.filter_data(cube, ['Customer', 'Subscriber'], ['0', '1', '2'])
+
+    cases = [
+        ('V2/V3 map',
+         lambda: tripCountV2.create_scattermapbox(cube, statistics),
+         lambda: create_scattermapbox_go(cube, statistics)),
+        ('V2 map filtered',
+         lambda: tripCountV2.create_scattermapbox_filtered(list_data, statistics),
+         lambda: create_scattermapbox_filtered_go(list_data, statistics,
+                                                  tripCountV2.create_layout_mapbox(statistics), False)),
+        ('V3 map filtered',
+         lambda: tripCountV3.create_scattermapbox_filtered(list_data, statistics),
+         lambda: create_scattermapbox_filtered_go(list_data, statistics,
+                                                  tripCountV3.create_layout_mapbox(statistics), True, True)),
+    ]
+    for column in ['Trip Duration', 'temp', 'Age 2020']:
+        for hist_show, box_show in [(True, True), (True, False), (False, True)]:
+            arguments = (column, hist_show, True, box_show, True)
+            cases.append(('{} hist={} box={}'.format(column, hist_show, box_show),
+                          lambda arguments=arguments: locationDistribution.create_figure(*arguments),
+                          lambda arguments=arguments: create_box_hist_go(*arguments)))
+
+    all_equal = True
+    print('{:<40} {:>6} {:>10} {:>10}'.format('figure', 'equal', 'dict [ms]', 'go [ms]'))
+    for name, create_dict, create_go in cases:
+        equal = to_json(create_dict()) == to_json(create_go())
+        all_equal = all_equal and equal
+        print('{:<40} {:>6} {:>10.2f} {:>10.2f}'.format(name, str(equal), measure(create_dict, repeat),
+                                                        measure(create_go, repeat)))
+    if not all_equal:
+        raise SystemExit('the figures differ')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parity and time of the figures built as dicts.')
+    parser.add_argument('--repeat', type=int, default=20)
+    main(parser.parse_args().repeat)
@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from data import get_default_month, get_file_version, get_month_paths, read_dataset, reload_interval
+from distribution import create_box_statistics, create_histogram, create_log_histogram, get_bin_spec, get_values
+
+'''
+Catalog of the numeric columns: count, missing values, range, moments, quantiles, histograms and box plot statistics
+of every column, computed once per data version and stored as JSON beside the parquet file of the month. The pages
+render their figures from the catalog, switching an option does not touch the data. The data is only read if the
+stored catalog is missing or belongs to another version of the file, and released once the catalog is written.
+'''
+
+# changes when the content of the catalog changes, catalogs of another format are computed again
+catalog_format = 2
+
+catalog_quantiles = [0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
+
+# catalogs read or computed by this process, (parquet path, file version) -> catalog, one version per path
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+# one lock per catalog being read or computed, a second request for it waits instead of computing it again
+_build_locks = {}
+
+
+def _to_float(value):
+    # JSON has no NaN, None for an undefined value (e.g. the standard deviation of one value)
+    return float(value) if value is not None and np.isfinite(value) else None
+
+
+def _to_histogram(histogram):
+    if histogram is None:
+        return None
+    (start, size, count), edges, counts = histogram
+    return dict(start=start, size=size, count=count, edges=[float(edge) for edge in edges],
+                counts=[int(count) for count in counts])
+
+
+def create_column_entry(series):
+    """
+    :param series: A numeric column.
+    :return: The statistics of the column as dict of JSON types, see catalog_quantiles, distribution.get_bin_spec,
+    distribution.create_log_histogram and distribution.create_box_statistics.
+    """
+    values = get_values(series)
+    entry = dict(dtype=str(series.dtype), count=len(values), nulls=int(len(series) - len(values)))
+    if len(values) == 0:
+        return entry
+
+    mean = values.mean()
+    deviations = values - mean
+    m2 = np.mean(deviations ** 2)
+    bin_spec = get_bin_spec(series)
+    box = create_box_statistics(series)
+    entry.update(
+        min=float(values.min()),
+        max=float(values.max()),
+        mean=float(mean),
+        std=_to_float(np.sqrt(m2 * len(values) / (len(values) - 1)) if len(values) > 1 else None),
+        skewness=_to_float(np.mean(deviations ** 3) / m2 ** 1.5 if m2 > 0 else None),
+        kurtosis=_to_float(np.mean(deviations ** 4) / m2 ** 2 - 3 if m2 > 0 else None),
+        quantiles=[float(value) for value in np.quantile(values, catalog_quantiles)],
+        histogram=_to_histogram((bin_spec,) + create_histogram(series, bin_spec)),
+        log_histogram=_to_histogram(create_log_histogram(series)),
+        box=dict(box, outliers=[float(value) for value in box['outliers']]),
+    )
+    return entry
+
+
+def create_catalog(data, version):
+    """
+    :param data: The dataset "numeric".
+    :param version: The version of the parquet file, see data.get_file_version.
+    :return: The catalog as dict with the format, the version and the entry of every numeric column.
+    """
+    columns = [column for column in data.columns
+               if pd.api.types.is_numeric_dtype(data[column].dtype)
+               and not pd.api.types.is_bool_dtype(data[column].dtype)]
+    return dict(
+        format=catalog_format,
+        version=version,
+        quantiles=catalog_quantiles,
+        columns={column: create_column_entry(data[column]) for column in columns},
+    )
+
+
+def get_catalog_path(path):
+    """
+    :param path: The parquet file or partition directory.
+    :return: The path of the catalog, beside the parquet file or in the partition directory (ignored by pyarrow,
+    starts with an underscore).
+    """
+    if os.path.isdir(path):
+        return os.path.join(path, '_catalog.json')
+    return os.path.splitext(path)[0] + '.catalog.json'
+
+
+def read_catalog(path, version):
+    """
+    :param path: The path of the catalog.
+    :param version: The version of the parquet file.
+    :return: The stored catalog, None if there is none or it belongs to another version or format.
+    """
+    try:
+        with open(path, encoding='utf-8') as file:
+            catalog = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if catalog.get('format') != catalog_format or catalog.get('version') != version:
+        return None
+    return catalog
+
+
+def write_catalog(path, catalog):
+    """
+    Writes the catalog to a temporary file and replaces the catalog at once, a page reading it at the same time gets
+    the old or the new catalog. The catalog is only kept in memory if the directory is read-only.
+    :param path: The path of the catalog.
+    :param catalog: The catalog, see create_catalog.
+    """
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(catalog, file, allow_nan=False)
+        os.replace(temporary_path, path)
+    except OSError as e:
+        print('catalog not stored: {}'.format(e))
+
+
+def _get_catalog(path, version):
+    key = (path, version)
+    with _catalogs_lock:
+        if key in _catalogs:
+            return _catalogs[key]
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+
+    with build_lock:
+        with _catalogs_lock:
+            if key in _catalogs:
+                return _catalogs[key]
+        catalog_path = get_catalog_path(path)
+        catalog = read_catalog(catalog_path, version)
+        if catalog is None:
+            # read outside of the registry (see data.get_dataset), the columns are released after computing
+            catalog = create_catalog(read_dataset('numeric', path), version)
+            write_catalog(catalog_path, catalog)
+        with _catalogs_lock:
+            for cached_key in [cached_key for cached_key in _catalogs if cached_key[0] == path]:
+                del _catalogs[cached_key]
+            _catalogs[key] = catalog
+            _build_locks.pop(key, None)
+        return catalog
+
+
+def get_catalog(month=None):
+    """
+    Returns the catalog of the month, read from its file or computed and stored if the file is missing or belongs to
+    another version of the parquet file. Only the version of the parquet file is checked for a catalog already read.
+    :param month: The month (YYYY-MM), defaults to the latest available month.
+    :return: The catalog, see create_catalog.
+    """
+    path = get_month_paths()[month if month is not None else get_default_month()]
+    # the version is taken before reading, a file changed while reading gets a new catalog on the next call
+    return _get_catalog(path, get_file_version(path))
+
+
+def get_column_entry(column, month=None):
+    """
+    :param column: The column of the dataset "numeric".
+    :param month: The month (YYYY-MM), defaults to the latest available month.
+    :return: The statistics of the column, see create_column_entry, None if the column is not in the catalog.
+    """
+    return get_catalog(month)['columns'].get(column)
+
+
+def _run_builder(interval):
+    while True:
+        try:
+            get_catalog()
+        except Exception as e:
+            # e.g. no data available yet or a file still being written, the catalog is built on the first use
+            print('catalog build failed: {}'.format(e))
+        if interval <= 0:
+            return
+        time.sleep(interval)
+
+
+def start_builder(interval=reload_interval):
+    """
+    Builds the catalog of the latest month in a daemon thread, so the server starts without waiting for it, and builds
+    it again every interval seconds if the data files have changed (see data.start_reloader).
+    :param interval: Seconds between two checks, 0 only builds the catalog once.
+    """
+    threading.Thread(target=_run_builder, args=(interval,), name='catalog-builder', daemon=True).start()
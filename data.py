@@ -1,11 +1,596 @@
+import glob
+import hashlib
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 data_path = os.path.join('./data/citibike/tripdata')
 
+# partitioned trip store: trips/year=YYYY/month=MM/*.parquet
+trips_path = os.path.join(data_path, 'trips')
+
+# the full data is too big for the free demo server, set DAVI_TRIPDATA=full to use it in production
+tripdata_mode = os.environ.get('DAVI_TRIPDATA', 'sample')
+
+# single month files, used for October 2019 if the trip store has no partition for it
+tripdata_files = {
+    'full': '201910-citibike-tripweather-data.parquet',
+    'sample': 'samples_5000_201910-citibike-tripweather-data.parquet',
+}
+tripdata_files_month = '2019-10'
+
+source_descriptions = {
+    'full': 'Alle Fahrten aus dem Monat {}',
+    'sample': '5000 zufällige Stichproben aus dem Monat {}',
+}
+
+month_names = ['Januar', 'Februar', 'März', 'April', 'Mai', 'Juni', 'Juli', 'August', 'September', 'Oktober',
+               'November', 'Dezember']
+
+# upper bound for the memory of all loaded datasets and their derived objects, the least recently used months are
+# evicted first
+cache_max_bytes = int(os.environ.get('DAVI_CACHE_MB', 2048)) * 1024 ** 2
+
+# columns used by the pages "Nutzung Stationen"
+station_columns = [
+    'Start Time',
+    'Start Station ID',
+    'Start Station Name',
+    'Start Station Latitude',
+    'Start Station Longitude',
+    'End Station ID',
+    'End Station Name',
+    'End Station Latitude',
+    'End Station Longitude',
+    'Trip Duration',
+    'User Type',
+    'Gender',
+]
+
+# weather of the trips' start hour, used by the pages "Nutzung Stationen" if the month contains them (see ingest.py)
+weather_columns = [
+    'temp',
+    'wind_speed',
+    'weather_main',
+]
+
+# string columns stored as categoricals and float columns where float32 is precise enough (~1m for coordinates)
+categorical_columns = [
+    'Start Station Name',
+    'End Station Name',
+    'User Type',
+    'Gender',
+    'weather_main',
+    'weather_description',
+]
+
+float32_columns = [
+    'Start Station Latitude',
+    'Start Station Longitude',
+    'End Station Latitude',
+    'End Station Longitude',
+    'Linear Distance',
+    'temp',
+    'wind_speed',
+    'rain_1h',
+    'snow_1h',
+]
+
+# datasets known to the registry, name -> columns to read (None reads all columns) or a function of the path to read
+datasets = {
+    'month': None,
+    'stations': lambda path: get_station_columns(path),
+    'numeric': lambda path: get_numeric_columns(path),
+}
+
+# every dataset is loaded only once per process and month and shared by all pages, (name, month) -> entry with the
+# data frame, its version and the objects derived from it
+_registry = OrderedDict()
+# only held to look up, insert or evict entries, the data is loaded and the derived objects are created outside of it
+_registry_lock = threading.RLock()
+# one lock per dataset being loaded, a second request for it waits for the first load instead of loading it again
+_load_locks = {}
+# entries pinned for the current thread (see snapshot) or being rebuilt by the reloader thread, the calls of this
+# thread resolve to them
+_pinned = threading.local()
+
+# seconds between two checks of the data files, 0 disables the reloader
+reload_interval = int(os.environ.get('DAVI_RELOAD_SECONDS', 60))
+
+
+def get_tripdata_file():
+    return os.path.join(data_path, tripdata_files[tripdata_mode])
+
+
+def get_month_paths():
+    """
+    Maps the available months to their parquet file or partition directory. Only the directory names are read, the
+    data of a month is loaded when the month is used for the first time.
+    :return: Sorted dict, month (YYYY-MM) -> path.
+    """
+    month_paths = {}
+    if tripdata_mode == 'full' and os.path.isdir(trips_path):
+        for year_dir in os.listdir(trips_path):
+            year_match = re.fullmatch(r'year=(\d{4})', year_dir)
+            if year_match is None:
+                continue
+            for month_dir in os.listdir(os.path.join(trips_path, year_dir)):
+                month_match = re.fullmatch(r'month=(\d{1,2})', month_dir)
+                if month_match is not None:
+                    month = '{}-{:02d}'.format(year_match.group(1), int(month_match.group(1)))
+                    month_paths[month] = os.path.join(trips_path, year_dir, month_dir)
+
+    if tripdata_files_month not in month_paths and os.path.exists(get_tripdata_file()):
+        month_paths[tripdata_files_month] = get_tripdata_file()
+
+    return dict(sorted(month_paths.items()))
+
+
+def get_months():
+    return list(get_month_paths().keys())
+
+
+def get_default_month():
+    return get_months()[-1]
+
+
+def get_month_label(month):
+    year, month_number = month.split('-')
+    return '{} {}'.format(month_names[int(month_number) - 1], year)
+
+
+def get_month_options():
+    return [dict(label=get_month_label(month), value=month) for month in reversed(get_months())]
+
+
+def get_source_description(month=None):
+    if tripdata_mode == 'sample':
+        # the samples are only available for one month
+        month = tripdata_files_month
+    if month is None:
+        return 'Alle Fahrten des ausgewählten Monats'
+    return source_descriptions[tripdata_mode].format(get_month_label(month))
+
+
+def get_schema(path=None):
+    """
+    :param path: The parquet file or partition directory, defaults to the latest available month.
+    :return: The arrow schema, read without loading any data.
+    """
+    schema = pq.ParquetDataset(path if path is not None else get_month_paths()[get_default_month()]).schema
+    return schema.to_arrow_schema() if hasattr(schema, 'to_arrow_schema') else schema
+
+
+def get_numeric_columns(path=None):
+    """
+    Reads the numeric columns from the parquet schema, without loading any data.
+    :param path: The parquet file or partition directory, defaults to the latest available month.
+    :return: The names of all integer and floating point columns.
+    """
+    return [field.name for field in get_schema(path)
+            if (pa.types.is_integer(field.type) or pa.types.is_floating(field.type))
+            and not field.name.startswith('__index_level_')]
+
+
+def get_station_columns(path=None):
+    """
+    :param path: The parquet file or partition directory, defaults to the latest available month.
+    :return: The station_columns and the weather_columns contained in the parquet schema.
+    """
+    names = get_schema(path).names
+    return station_columns + [column for column in weather_columns if column in names]
+
+
+def create_filters(user_types=None, genders=None, start=None, end=None):
+    """
+    Creates the filters for read_trips in the disjunctive normal form used by pyarrow.
+    :param user_types: The user types to keep, None or empty keeps all.
+    :param genders: The genders to keep, None or empty keeps all.
+    :param start: Keeps trips started at or after this time.
+    :param end: Keeps trips started before this time.
+    :return: The filters or None if nothing has to be filtered.
+    """
+    filters = []
+    if user_types is not None and len(user_types) > 0:
+        filters.append(('User Type', 'in', list(user_types)))
+    if genders is not None and len(genders) > 0:
+        filters.append(('Gender', 'in', list(genders)))
+    if start is not None:
+        filters.append(('Start Time', '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append(('Start Time', '<', pd.Timestamp(end)))
+    return filters if len(filters) > 0 else None
+
+
+def read_trips(columns=None, filters=None, path=None):
+    """
+    Reads trips through pyarrow. Only the given columns are read and the filters are pushed down, so row groups not
+    matching the filters (according to their statistics) are skipped.
+    :param columns: The columns to read, None reads all columns.
+    :param filters: The filters, see create_filters.
+    :param path: The parquet file or partition directory to read, defaults to the trip data file of the current mode.
+    :return: The trips as data frame.
+    """
+    table = pq.read_table(
+        path if path is not None else get_tripdata_file(),
+        columns=columns,
+        filters=filters,
+        use_pandas_metadata=True
+    )
+    return table.to_pandas()
+
+
+def _get_smallest_int_dtype(min_value, max_value, nullable):
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        if np.iinfo(dtype).min <= min_value and max_value <= np.iinfo(dtype).max:
+            return pd.api.types.pandas_dtype(np.dtype(dtype).name.capitalize()) if nullable else np.dtype(dtype)
+
+
+def optimize_dtypes(df):
+    """
+    Converts the columns to compact dtypes: strings to categoricals, the float32_columns to float32 and integers
+    (also the nullable ones) to the smallest integer type holding all values.
+    :param df: The data frame to optimize.
+    :return: The optimized data frame and a report with dtype and bytes of each column before and after.
+    """
+    optimized = {}
+    for col in df.columns:
+        series = df[col]
+        if col in categorical_columns or (series.dtype == object and series.nunique() < len(series) / 2):
+            series = series.astype('category')
+        elif col in float32_columns and series.dtype == np.float64:
+            series = series.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(series.dtype) and series.count() > 0:
+            nullable = not isinstance(series.dtype, np.dtype)
+            series = series.astype(_get_smallest_int_dtype(series.min(), series.max(), nullable))
+        optimized[col] = series
+    df_optimized = pd.DataFrame(optimized, index=df.index)
+
+    report = pd.DataFrame({
+        'dtype before': df.dtypes.astype(str),
+        'bytes before': df.memory_usage(index=False, deep=True),
+        'dtype after': df_optimized.dtypes.astype(str),
+        'bytes after': df_optimized.memory_usage(index=False, deep=True),
+    })
+
+    return df_optimized, report
+
+
+def to_plot_values(series):
+    """
+    Converts floating point values to float64 with the shortest representation of their float32 value, otherwise the
+    JSON of the figures would contain the noise of the downcasted values (e.g. 17.379999160766602 instead of 17.38).
+    :param series: The values to plot.
+    :return: The values as float64 if they are floating point values, otherwise unchanged.
+    """
+    if pd.api.types.is_float_dtype(series.dtype):
+        return series.astype(np.float32).astype(str).astype(np.float64)
+    return series
+
+
+def _freeze(df):
+    """
+    Marks the arrays backing the data frame as read-only, so a page can not modify the shared dataset in place.
+    :param df: The data frame to freeze.
+    :return: The same data frame.
+    """
+    manager = getattr(df, '_mgr', None) or df._data
+    for block in manager.blocks:
+        arrays = [block.values] + [getattr(block.values, attr, None) for attr in ('_data', '_mask', '_codes')]
+        for array in arrays:
+            if isinstance(array, np.ndarray):
+                array.flags.writeable = False
+    return df
+
+
+def get_file_version(path):
+    """
+    Computes the version of a parquet file or partition directory from the size and modification time of its files,
+    without reading them.
+    :param path: The parquet file or partition directory.
+    :return: The version as hex string.
+    """
+    paths = [path] if os.path.isfile(path) else sorted(glob.glob(os.path.join(path, '**', '*.parquet'), recursive=True))
+    signature = [(os.path.relpath(file, path), os.stat(file).st_size, os.stat(file).st_mtime_ns) for file in paths]
+    return hashlib.md5(repr(signature).encode()).hexdigest()[:12]
+
+
+def _get_key(name, month):
+    if month is None:
+        # the default month of a snapshot, even if a new month has been added since
+        month = getattr(_pinned, 'default_months', {}).get(name) or get_default_month()
+    return name, month
+
+
+def _read(name, path):
+    columns = datasets[name](path) if callable(datasets[name]) else datasets[name]
+    return optimize_dtypes(read_trips(columns=columns, path=path))
+
+
+def read_dataset(name, path):
+    """
+    Reads a dataset without adding it to the registry, e.g. to compute a result that is stored, the data is released
+    as soon as it is no longer used.
+    :param name: The name of the dataset, see datasets.
+    :param path: The parquet file or partition directory, see get_month_paths.
+    :return: The data frame with optimized dtypes.
+    """
+    return _read(name, path)[0]
+
+
+def _load(name, month):
+    path = get_month_paths()[month]
+    # the version is taken before reading, a file changed while reading is reloaded by the next check
+    version = get_file_version(path)
+    df, report = _read(name, path)
+    return dict(
+        data=_freeze(df),
+        report=report,
+        memory=int(df.memory_usage(index=True, deep=True).sum()),
+        version=version,
+        derived={},
+        creators={},
+        # one lock per derived object being created, see _create_derived
+        derived_locks={},
+    )
+
+
+def get_nbytes(obj, seen=None):
+    """
+    Estimates the memory of a derived object from its arrays and data frames, other values are not counted.
+    :param obj: The derived object, e.g. an aggregate or an index.
+    :param seen: The IDs of the objects already counted.
+    :return: The memory in bytes.
+    """
+    seen = seen if seen is not None else set()
+    if obj is None or id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        memory = obj.memory_usage(index=True, deep=True)
+        return int(memory.sum()) if isinstance(obj, pd.DataFrame) else int(memory)
+    if isinstance(obj, dict):
+        return sum(get_nbytes(value, seen) for value in obj.values())
+    if isinstance(obj, (list, tuple, set)):
+        return sum(get_nbytes(value, seen) for value in obj)
+    if hasattr(obj, '__dict__'):
+        return get_nbytes(vars(obj), seen)
+    return 0
+
+
+def _evict(keep_key):
+    # the least recently used datasets are the first ones in the registry, their memory includes the derived objects
+    while sum(entry['memory'] for entry in _registry.values()) > cache_max_bytes and len(_registry) > 1:
+        key = next(iter(_registry))
+        if key == keep_key:
+            _registry.move_to_end(key)
+            continue
+        del _registry[key]
+
+
+def _get_entry(key):
+    pinned = getattr(_pinned, 'entries', {})
+    if key in pinned:
+        return pinned[key]
+    with _registry_lock:
+        if key in _registry:
+            _registry.move_to_end(key)
+            return _registry[key]
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    # the other datasets stay available while the month is read
+    with load_lock:
+        with _registry_lock:
+            if key in _registry:
+                # loaded by another request in the meantime
+                _registry.move_to_end(key)
+                return _registry[key]
+        entry = _load(*key)
+        with _registry_lock:
+            _registry[key] = entry
+            _evict(key)
+            _load_locks.pop(key, None)
+            return entry
+
+
+def get_dataset(name, month=None):
+    """
+    Returns a read-only view of the dataset. The month is only read on the first call, every further call shares the
+    already loaded data until the month is evicted (see cache_max_bytes) or reloaded (see start_reloader).
+    :param name: The name of the dataset, see datasets.
+    :param month: The month (YYYY-MM), defaults to the latest available month.
+    :return: A shallow copy of the shared data frame.
+    """
+    # shallow copy: adding or dropping columns does not affect the other pages
+    return _get_entry(_get_key(name, month))['data'].copy(deep=False)
+
+
+def get_data_version(name, month=None):
+    """
+    :param name: The name of the dataset, see datasets.
+    :param month: The month (YYYY-MM), defaults to the latest available month.
+    :return: The version of the loaded dataset, changes when the dataset is reloaded.
+    """
+    return _get_entry(_get_key(name, month))['version']
+
+
+def _create_derived(key, entry, derived_name, create):
+    if derived_name in entry['derived']:
+        return entry['derived'][derived_name]
+    with _registry_lock:
+        derived_lock = entry['derived_locks'].setdefault(derived_name, threading.Lock())
+
+    # only the requests for the same derived object wait for it, a derived object created from other derived objects
+    # takes their locks, never its own
+    with derived_lock:
+        if derived_name not in entry['derived']:
+            # the derived objects it is created from are taken from the same version
+            with _pin(key, entry):
+                derived = create(entry['data'].copy(deep=False), key[1])
+            with _registry_lock:
+                entry['derived'][derived_name] = derived
+                entry['creators'][derived_name] = create
+                entry['memory'] += get_nbytes(derived)
+                if _registry.get(key) is entry:
+                    _evict(key)
+    return entry['derived'][derived_name]
+
+
+def get_derived(name, derived_name, create, month=None):
+    """
+    Returns an object derived from the dataset (e.g. an aggregate). It is created once per loaded dataset, rebuilt when
+    the dataset is reloaded and evicted together with the dataset.
+    :param name: The name of the dataset, see datasets.
+    :param derived_name: The name of the derived object.
+    :param create: Function creating the derived object from the dataset and the month, it may not depend on anything
+    else of the month, so it is also used to create the derived object of another month in advance (see
+    check_data_files).
+    :param month: The month (YYYY-MM), defaults to the latest available month.
+    :return: The derived object.
+    """
+    key = _get_key(name, month)
+    return _create_derived(key, _get_entry(key), derived_name, create)
+
+
+@contextmanager
+def _pin(key, entry, default=False):
+    entries = getattr(_pinned, 'entries', {})
+    default_months = getattr(_pinned, 'default_months', {})
+    _pinned.entries = {**entries, key: entry}
+    if default:
+        _pinned.default_months = {**default_months, key[0]: key[1]}
+    try:
+        yield entry
+    finally:
+        _pinned.entries = entries
+        _pinned.default_months = default_months
+
+
+@contextmanager
+def snapshot(name, month=None):
+    """
+    Pins the loaded version of a dataset for the current thread, every get_dataset, get_derived and get_data_version of
+    the dataset and month within the block returns the same version, even if the reloader replaces it in the meantime.
+    A callback resolves all its outputs within one snapshot, so they are not mixed from two versions.
+    :param name: The name of the dataset, see datasets.
+    :param month: The month (YYYY-MM), defaults to the latest available month.
+    :return: Context manager giving the version of the dataset.
+    """
+    key = _get_key(name, month)
+    with _pin(key, _get_entry(key), default=month is None) as entry:
+        yield entry['version']
+
+
+def _reload(key, entry=None, creators=None):
+    """
+    Loads the new version of a dataset and rebuilds its derived objects, while the pages keep using the old version.
+    The new version replaces the old one at once, callbacks already running finish with the old version.
+    :param key: The dataset name and month.
+    :param entry: The loaded version, None if the dataset is not loaded yet.
+    :param creators: The functions creating the derived objects (see get_derived), defaults to the ones of entry.
+    """
+    if creators is None and entry is not None:
+        with _registry_lock:
+            creators = dict(entry['creators'])
+    new_entry = _load(*key)
+    # only visible to the reloader thread, the pages are not blocked while it is rebuilt
+    with _pin(key, new_entry):
+        for derived_name, create in (creators or {}).items():
+            get_derived(key[0], derived_name, create, key[1])
+
+    with _registry_lock:
+        # not replaced if the dataset was evicted or loaded by a page in the meantime
+        if _registry.get(key) is entry:
+            _registry[key] = new_entry
+            _evict(key)
+
+
+def check_data_files():
+    """
+    Reloads the loaded datasets whose files have changed. A new latest month is loaded in advance for the datasets
+    used with the latest month, together with their derived objects, so switching the default month does not slow down
+    the next request.
+    :return: The reloaded or preloaded datasets.
+    """
+    month_paths = get_month_paths()
+    default_month = get_default_month()
+    with _registry_lock:
+        entries = list(_registry.items())
+
+    updated = []
+    for key, entry in entries:
+        name, month = key
+        if month in month_paths and get_file_version(month_paths[month]) != entry['version']:
+            _reload(key, entry)
+            updated.append(key)
+        if month != default_month and (name, default_month) not in _registry:
+            # the derived objects of the month used so far are created for the new month, too
+            with _registry_lock:
+                creators = dict(entry['creators'])
+            _reload((name, default_month), creators=creators)
+            updated.append((name, default_month))
+    return updated
+
+
+def _run_reloader(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            for key in check_data_files():
+                print('data reloaded: {} {}'.format(*key))
+        except Exception as e:
+            # e.g. a file still being written, the old version is kept until the next check
+            print('data reload failed: {}'.format(e))
+
+
+def start_reloader(interval=reload_interval):
+    """
+    Starts a daemon thread checking the data files every interval seconds (see check_data_files), so new data is used
+    without restarting the server.
+    :param interval: Seconds between two checks, 0 does not start the reloader.
+    """
+    if interval > 0:
+        threading.Thread(target=_run_reloader, args=(interval,), name='data-reloader', daemon=True).start()
+
+
+def get_memory_usage():
+    """
+    :return: The memory used by each loaded dataset and month and its derived objects in bytes, measured when the
+    dataset was loaded and when a derived object was created.
+    """
+    with _registry_lock:
+        return {'{} {}'.format(*key): entry['memory'] for key, entry in _registry.items()}
+
+
+def get_memory_report(name, month=None):
+    """
+    :param name: The name of a loaded dataset.
+    :param month: The month (YYYY-MM), defaults to the latest available month.
+    :return: The dtype and bytes of each column before and after optimize_dtypes.
+    """
+    with _registry_lock:
+        return _registry[_get_key(name, month)]['report'].copy()
+
 
 def read_df_month():
-    hostname = os.uname()[1]
-    # return pd.read_parquet(os.path.join(data_path, '201910-citibike-tripweather-data.parquet'))
-    return pd.read_parquet(os.path.join(data_path, 'samples_5000_201910-citibike-tripweather-data.parquet'))
+    return get_dataset('month')
+
+
+if __name__ == '__main__':
+    for dataset_name in datasets:
+        get_dataset(dataset_name)
+        dataset_report = get_memory_report(dataset_name)
+        print('{} ({}):'.format(dataset_name, get_month_paths()[get_default_month()]))
+        print(dataset_report.to_string())
+        print('total: {:,d} -> {:,d} bytes\n'.format(dataset_report['bytes before'].sum(),
+                                                     dataset_report['bytes after'].sum()))
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+from data import to_plot_values
+
+'''
+Distributions of the numeric columns computed on the server (histograms and box plot statistics), stored per data
+version in the catalog (see catalog.py), so the figures of the page "Lage & Streuung" contain a few hundred numbers per
+graph instead of the values of all trips.
+'''
+
+# the number of bins grows with the cube root of the number of values (Rice rule) within these limits
+min_bins = 10
+max_bins = 200
+
+
+def get_values(series):
+    """
+    :param series: A numeric column.
+    :return: The values without missing values as float64 array.
+    """
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    return values[~np.isnan(values)]
+
+
+def get_nice_size(size, integer=False):
+    """
+    :param size: The minimal width of a bin.
+    :param integer: The values are integers, the width is at least 1.
+    :return: The smallest width of 1, 2, 2.5 or 5 times a power of ten not smaller than size.
+    """
+    if integer and size <= 1:
+        return 1.0
+    if size <= 0 or not np.isfinite(size):
+        return 1.0
+    magnitude = 10 ** np.floor(np.log10(size))
+    for factor in (1, 2, 2.5, 5, 10):
+        if factor * magnitude >= size:
+            return float(factor * magnitude)
+
+
+def get_bin_spec(series, bins=None):
+    """
+    :param series: A numeric column.
+    :param bins: The number of bins, None chooses it from the number of values.
+    :return: The bins as (start, size, count), start and size are rounded to a nice width, count is at most
+    max_bins. None if the column has no values.
+    """
+    values = get_values(series)
+    if len(values) == 0:
+        return None
+    bins = bins if bins is not None else int(np.clip(2 * np.cbrt(len(values)), min_bins, max_bins))
+    low, high = values.min(), values.max()
+    size = get_nice_size((high - low) / bins, integer=pd.api.types.is_integer_dtype(series.dtype))
+    start = np.floor(low / size) * size
+    while np.floor((high - start) / size) + 1 > max_bins:
+        # the start is rounded down, the next nice width if that needs one bin too many
+        size = get_nice_size(size * 1.01)
+        start = np.floor(low / size) * size
+    return float(start), size, int(np.floor((high - start) / size)) + 1
+
+
+def create_histogram(series, bin_spec):
+    """
+    Counts the values per bin in one pass.
+    :param series: A numeric column.
+    :param bin_spec: The bins as (start, size, count), see get_bin_spec.
+    :return: The lower edges of the bins and the number of values per bin.
+    """
+    start, size, count = bin_spec
+    indexes = np.floor((get_values(series) - start) / size).astype(np.int64)
+    counts = np.bincount(np.clip(indexes, 0, count - 1), minlength=count)
+    return start + size * np.arange(count), counts
+
+
+def create_log_histogram(series, bins=None):
+    """
+    Counts the positive values in bins of equal width on a logarithmic x axis, e.g. for the long tail of Trip Duration.
+    :param series: A numeric column.
+    :param bins: The number of bins, None chooses it from the number of positive values.
+    :return: The bins as (start, size, count) of the decimal logarithm of the values, the lower edges of the bins and
+    the number of values per bin. None if the column has no positive values.
+    """
+    values = get_values(series)
+    logs = pd.Series(np.log10(values[values > 0]))
+    bin_spec = get_bin_spec(logs, bins)
+    if bin_spec is None:
+        return None
+    edges, counts = create_histogram(logs, bin_spec)
+    return bin_spec, 10 ** edges, counts
+
+
+# outliers sent to the browser per box plot
+max_outliers = 1000
+
+
+def create_box_statistics(series):
+    """
+    Computes the statistics of a box plot like plotly.js: quartiles (linear interpolation), the fences as the most
+    extreme values within 1.5 times the interquartile range and the values outside the fences as outliers.
+    :param series: A numeric column.
+    :return: The statistics as dict (q1, median, q3, lowerfence, upperfence, mean, outlier_count and a sample of up to
+    max_outliers outliers including the extremes), None if the column has no values.
+    """
+    values = get_values(series)
+    if len(values) == 0:
+        return None
+
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    mean = values.mean()
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+
+    inside = (values >= low) & (values <= high)
+    outliers = values[~inside]
+    if len(outliers) > max_outliers:
+        sample = np.random.RandomState(0).choice(len(outliers), max_outliers - 2, replace=False)
+        outliers = np.concatenate([[outliers.min(), outliers.max()], outliers[sample]])
+    if pd.api.types.is_float_dtype(series.dtype):
+        outliers = to_plot_values(pd.Series(outliers.astype(series.dtype))).to_numpy()
+
+    return dict(
+        q1=float(q1), median=float(median), q3=float(q3),
+        lowerfence=float(values[inside].min()) if inside.any() else float(q1),
+        upperfence=float(values[inside].max()) if inside.any() else float(q3),
+        mean=float(mean),
+        outliers=outliers,
+        outlier_count=int(len(values) - np.count_nonzero(inside)),
+    )
+
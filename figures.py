@@ -0,0 +1,67 @@
+import copy
+import functools
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+from plotly.subplots import make_subplots
+
+'''
+Builds figures as plain dicts with the same JSON as plotly.graph_objects, but without validating and copying every
+property. Use graph_objects for new figures first and switch to these helpers when the figure is on a hot path, see
+benchmarks/check_figures.py for the comparison of both.
+'''
+
+
+@functools.lru_cache(maxsize=None)
+def get_template():
+    # go.Figure adds the default template to the layout of every figure
+    return pio.templates[pio.templates.default].to_plotly_json()
+
+
+def to_array(values):
+    """
+    :param values: The values of a trace property (Series, numpy array or list).
+    :return: The values as list, nullable integers as float with NaN for missing values.
+    """
+    if isinstance(values, pd.Series) and not isinstance(values.dtype, np.dtype):
+        values = values.astype(np.float64)
+    return np.asarray(values).tolist()
+
+
+def build_figure(traces, layout):
+    """
+    :param traces: The traces as dicts, e.g. dict(type='scattermapbox', lat=..., lon=...).
+    :param layout: The layout as dict.
+    :return: The figure as dict, with the default template like go.Figure.
+    """
+    return dict(data=traces, layout=dict(layout, template=get_template()))
+
+
+@functools.lru_cache(maxsize=256)
+def _get_subplots_layout(rows, cols, shared_xaxes, vertical_spacing, y_title, row_heights):
+    layout = make_subplots(
+        rows=rows, cols=cols,
+        shared_xaxes=shared_xaxes,
+        print_grid=False,
+        vertical_spacing=vertical_spacing,
+        y_title=y_title,
+        row_heights=list(row_heights) if row_heights is not None else None
+    ).to_plotly_json()['layout']
+    layout.pop('template', None)
+    return layout
+
+
+def get_subplots_layout(rows, cols=1, shared_xaxes=False, vertical_spacing=None, y_title=None, row_heights=None):
+    """
+    Creates the axes and titles of make_subplots once per combination of the arguments.
+    :return: A copy of the layout, the traces of row r and column c refer to the axes x<n> and y<n> with
+    n = (r - 1) * cols + c (no number for n = 1).
+    """
+    return copy.deepcopy(_get_subplots_layout(rows, cols, shared_xaxes, vertical_spacing, y_title,
+                                              tuple(row_heights) if row_heights is not None else None))
+
+
+def get_axis_suffix(row, col=1, cols=1):
+    number = (row - 1) * cols + col
+    return '' if number == 1 else str(number)
@@ -0,0 +1,407 @@
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data import data_path, trips_path
+
+# column names of the different CSV versions (lower case, without spaces) -> column name in the trip store
+tripdata_column_names = {
+    'tripduration': 'Trip Duration',
+    'starttime': 'Start Time',
+    'stoptime': 'Stop Time',
+    'startstationid': 'Start Station ID',
+    'startstationname': 'Start Station Name',
+    'startstationlatitude': 'Start Station Latitude',
+    'startstationlongitude': 'Start Station Longitude',
+    'endstationid': 'End Station ID',
+    'endstationname': 'End Station Name',
+    'endstationlatitude': 'End Station Latitude',
+    'endstationlongitude': 'End Station Longitude',
+    'bikeid': 'Bike ID',
+    'usertype': 'User Type',
+    'birthyear': 'Birth Year',
+    'gender': 'Gender',
+}
+
+# the date formats used in the CSVs over the years
+tripdata_date_formats = [
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%d %H:%M:%S',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+]
+
+tripdata_timezone = 'US/Eastern'
+
+# unrealistic trips, see notebook 0_1_Tripdata-Datenaufbereitung
+max_trip_duration = 6 * 60 * 60
+max_linear_distance = 30
+max_age = 81
+age_reference_year = 2020
+
+tripdata_schema = pa.schema([
+    ('dt_utc', pa.timestamp('ms', tz='UTC')),
+    ('Trip Duration', pa.int64()),
+    ('Start Time', pa.timestamp('ms', tz=tripdata_timezone)),
+    ('Stop Time', pa.timestamp('ms', tz=tripdata_timezone)),
+    ('Start Station ID', pa.int64()),
+    ('Start Station Name', pa.string()),
+    ('Start Station Latitude', pa.float64()),
+    ('Start Station Longitude', pa.float64()),
+    ('End Station ID', pa.int64()),
+    ('End Station Name', pa.string()),
+    ('End Station Latitude', pa.float64()),
+    ('End Station Longitude', pa.float64()),
+    ('Bike ID', pa.int64()),
+    ('User Type', pa.string()),
+    ('Birth Year', pa.int64()),
+    ('Gender', pa.string()),
+    ('Linear Distance', pa.float64()),
+    ('Age 2020', pa.int64()),
+])
+
+# hourly weather merged onto the trips, see notebook 0_3_Merge-Weatherdata2Tripdata
+weather_fields = [
+    ('temp', pa.float64()),
+    ('pressure', pa.int64()),
+    ('humidity', pa.int64()),
+    ('wind_speed', pa.float64()),
+    ('rain_1h', pa.float64()),
+    ('snow_1h', pa.float64()),
+    ('clouds_all', pa.int64()),
+    ('weather_id', pa.int64()),
+    ('weather_main', pa.string()),
+    ('weather_description', pa.string()),
+]
+weather_columns = [name for name, _ in weather_fields]
+
+tripweather_schema = pa.schema(list(tripdata_schema)
+                               + [pa.field(name, field_type) for name, field_type in weather_fields])
+
+# a trip gets the weather measured nearest to its start (the hourly weather is matched up to this distance)
+weather_tolerance = pd.Timedelta(hours=1)
+
+
+def parse_datetimes(values):
+    """
+    Parses the date strings of the CSVs, which use different formats over the years.
+    :param values: The date strings.
+    :return: The parsed (naive) datetimes, NaT if no format matched.
+    """
+    result = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for date_format in tripdata_date_formats:
+        missing = result.isna() & values.notna()
+        if not missing.any():
+            break
+        result[missing] = pd.to_datetime(values[missing], format=date_format, errors='coerce')
+    return result
+
+
+def get_linear_distance(lat_start, lon_start, lat_end, lon_end):
+    """
+    :return: The distance in km along the great circle (haversine formula).
+    """
+    lat_start, lon_start, lat_end, lon_end = (np.radians(values) for values in (lat_start, lon_start, lat_end, lon_end))
+    a = np.sin((lat_end - lat_start) / 2) ** 2 + np.cos(lat_start) * np.cos(lat_end) * np.sin(
+        (lon_end - lon_start) / 2) ** 2
+    return 6371.0 * 2 * np.arcsin(np.sqrt(a))
+
+
+def clean_tripdata(df):
+    """
+    Applies the preparation of notebook 0_1_Tripdata-Datenaufbereitung to a chunk of a tripdata CSV.
+    :param df: The chunk as read from the CSV.
+    :return: The cleaned trips with the columns of tripdata_schema.
+    """
+    df = df.rename(columns=lambda name: tripdata_column_names.get(name.lower().replace(' ', ''), name))
+
+    # missing user types are customers, trips without start or end station are removed
+    df['User Type'] = df['User Type'].fillna('Customer')
+    for col in ['Start Station ID', 'End Station ID', 'Trip Duration', 'Bike ID', 'Birth Year',
+                'Start Station Latitude', 'Start Station Longitude', 'End Station Latitude', 'End Station Longitude']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df = df[df['Start Station ID'].notna() & df['End Station ID'].notna() & df['Trip Duration'].notna()]
+
+    # the repeated hour at the end of the daylight saving time is taken as DST, the stop time is derived from the
+    # duration, so start and stop are consistent also in this hour; times with sub-millisecond digits are truncated to
+    # the milliseconds of tripdata_schema, so all partitions of a store keep one unit
+    start_time = parse_datetimes(df['Start Time']).dt.floor('ms').dt.tz_localize(
+        tripdata_timezone,
+        ambiguous=np.ones(len(df), dtype=bool),
+        nonexistent='shift_forward'
+    )
+    df = df.assign(**{
+        'Start Time': start_time,
+        'Stop Time': start_time + pd.to_timedelta(df['Trip Duration'], unit='s'),
+        'dt_utc': start_time.dt.tz_convert('UTC'),
+        'Trip Duration': df['Trip Duration'].astype(np.int64),
+        'Start Station ID': df['Start Station ID'].astype(np.int64),
+        'End Station ID': df['End Station ID'].astype(np.int64),
+        'Bike ID': df['Bike ID'].astype('Int64'),
+        'Birth Year': df['Birth Year'].astype('Int64'),
+        'Gender': df['Gender'].str.strip(),
+        'Age 2020': age_reference_year - df['Birth Year'].astype('Int64'),
+        'Linear Distance': get_linear_distance(df['Start Station Latitude'], df['Start Station Longitude'],
+                                               df['End Station Latitude'], df['End Station Longitude']),
+    })
+
+    # unrealistic trips
+    df = df[df['Start Time'].notna()
+            & (df['Trip Duration'] <= max_trip_duration)
+            & (df['Linear Distance'] <= max_linear_distance)
+            & ~(df['Age 2020'] > max_age).fillna(False)]
+
+    return df[tripdata_schema.names]
+
+
+def get_marker_path(output_path, csv_path):
+    return os.path.join(output_path, '_ingested', os.path.basename(csv_path) + '.json')
+
+
+def get_source_info(csv_path):
+    stat = os.stat(csv_path)
+    return dict(source=os.path.abspath(csv_path), size=stat.st_size, mtime=stat.st_mtime)
+
+
+def is_converted(output_path, csv_path):
+    marker_path = get_marker_path(output_path, csv_path)
+    if not os.path.exists(marker_path):
+        return False
+    with open(marker_path) as marker_file:
+        marker = json.load(marker_file)
+    source_info = get_source_info(csv_path)
+    return all(marker.get(key) == value for key, value in source_info.items())
+
+
+def convert_tripdata_csv(csv_path, output_path, chunksize):
+    """
+    Converts a tripdata CSV chunk by chunk into the partitions year=YYYY/month=MM of the trip store. Each CSV gets its
+    own file in the partitions, with one row group per chunk.
+    :param csv_path: The CSV to convert.
+    :param output_path: The root directory of the trip store.
+    :param chunksize: The number of CSV rows processed at once.
+    :return: The number of rows read and written.
+    """
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    # remove the files of an interrupted run
+    for old_file in glob.glob(os.path.join(output_path, 'year=*', 'month=*', name + '.parquet')):
+        os.remove(old_file)
+
+    writers = {}
+    rows_read = 0
+    rows_written = 0
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype=str, na_values=['\\N', 'NULL']):
+            rows_read += len(chunk)
+            df = clean_tripdata(chunk)
+            rows_written += len(df)
+            start_time = df['Start Time'].dt
+            for (year, month), df_partition in df.groupby([start_time.year, start_time.month]):
+                if (year, month) not in writers:
+                    partition_path = os.path.join(output_path, 'year={}'.format(year), 'month={}'.format(month))
+                    os.makedirs(partition_path, exist_ok=True)
+                    writers[(year, month)] = pq.ParquetWriter(os.path.join(partition_path, name + '.parquet'),
+                                                              tripdata_schema)
+                writers[(year, month)].write_table(
+                    pa.Table.from_pandas(df_partition, schema=tripdata_schema, preserve_index=False)
+                )
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    os.makedirs(os.path.dirname(get_marker_path(output_path, csv_path)), exist_ok=True)
+    with open(get_marker_path(output_path, csv_path), 'w') as marker_file:
+        json.dump(dict(get_source_info(csv_path), rows_read=rows_read, rows_written=rows_written), marker_file)
+
+    return rows_read, rows_written
+
+
+def find_csv_files(paths):
+    csv_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            csv_files.extend(sorted(glob.glob(os.path.join(path, '**', '*.csv'), recursive=True)))
+        else:
+            csv_files.append(path)
+    return csv_files
+
+
+def ingest_tripdata(args):
+    csv_files = [csv_path for csv_path in find_csv_files(args.paths)
+                 if args.force or not is_converted(args.output, csv_path)]
+    print('{} CSV files to convert'.format(len(csv_files)))
+
+    start = time.time()
+    total_read = 0
+    total_written = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(convert_tripdata_csv, csv_path, args.output, args.chunksize): csv_path
+            for csv_path in csv_files
+        }
+        for future in as_completed(futures):
+            rows_read, rows_written = future.result()
+            total_read += rows_read
+            total_written += rows_written
+            elapsed = time.time() - start
+            print('{}: {:,d} rows read, {:,d} rows written ({:,.0f} rows/s overall)'.format(
+                os.path.basename(futures[future]), rows_read, rows_written, total_read / max(elapsed, 1e-9)))
+
+    elapsed = time.time() - start
+    print('{:,d} rows read, {:,d} rows written in {:.1f}s ({:,.0f} rows/s)'.format(
+        total_read, total_written, elapsed, total_read / max(elapsed, 1e-9)))
+
+
+def read_weather(path):
+    """
+    Reads the hourly weather (CSV as exported by OpenWeather or parquet) and prepares it for merge_weather.
+    :param path: The weather file, with the time either in 'dt' (unix time) or in 'dt_utc'.
+    :return: The weather sorted by the time 'dt_weather' (UTC), one row per point in time.
+    """
+    if path.endswith('.parquet'):
+        df_weather = pd.read_parquet(path)
+    else:
+        df_weather = pd.read_csv(path)
+
+    if 'dt_utc' in df_weather.columns:
+        dt_weather = pd.to_datetime(df_weather['dt_utc'], utc=True)
+    else:
+        dt_weather = pd.to_datetime(df_weather['dt'], unit='s', utc=True)
+
+    df_weather = df_weather.assign(dt_weather=dt_weather)[['dt_weather'] + weather_columns]
+    # OpenWeather has a row for each weather condition of an hour, the first one is the primary condition
+    df_weather = df_weather.drop_duplicates(subset='dt_weather', keep='first').sort_values('dt_weather')
+    df_weather[['rain_1h', 'snow_1h']] = df_weather[['rain_1h', 'snow_1h']].fillna(0.0)
+    df_weather['dt_weather'] = df_weather['dt_weather'].astype('datetime64[ns, UTC]')
+
+    return df_weather.reset_index(drop=True)
+
+
+def merge_weather(df_trips, df_weather):
+    """
+    Merges the weather onto the trips with an as-of join on the start time in UTC.
+    :param df_trips: The trips, see tripdata_schema.
+    :param df_weather: The weather, see read_weather.
+    :return: The trips sorted by start time with the weather columns.
+    """
+    df_trips = df_trips.drop(columns=[col for col in weather_columns if col in df_trips.columns])
+    df_trips = df_trips.assign(dt_utc=df_trips['dt_utc'].astype('datetime64[ns, UTC]')).sort_values('dt_utc')
+
+    df_merged = pd.merge_asof(
+        df_trips,
+        df_weather,
+        left_on='dt_utc',
+        right_on='dt_weather',
+        direction='nearest',
+        tolerance=weather_tolerance
+    )
+
+    # integer columns get missing values for trips without weather
+    for name, field_type in weather_fields:
+        if pa.types.is_integer(field_type):
+            df_merged[name] = df_merged[name].astype('Int64')
+
+    return df_merged.drop(columns='dt_weather')
+
+
+def has_weather(parquet_path):
+    return all(name in pq.read_schema(parquet_path).names for name in weather_columns)
+
+
+def merge_weather_file(parquet_path, df_weather):
+    """
+    Merges the weather onto the trips of one file of the trip store. Only this file is held in memory, the file is
+    replaced when the merged trips are completely written.
+    :param parquet_path: The file of the trip store.
+    :param df_weather: The weather, see read_weather.
+    :return: The number of trips and the number of trips without weather.
+    """
+    df_trips = pq.read_table(parquet_path, columns=tripdata_schema.names).to_pandas()
+    df_merged = merge_weather(df_trips, df_weather)
+
+    tmp_path = parquet_path + '.tmp'
+    pq.write_table(
+        pa.Table.from_pandas(df_merged, schema=tripweather_schema, preserve_index=False),
+        tmp_path,
+        row_group_size=500000
+    )
+    os.replace(tmp_path, parquet_path)
+
+    return len(df_merged), int(df_merged['temp'].isna().sum())
+
+
+def ingest_weather(args):
+    df_weather = read_weather(args.weather)
+    parquet_files = [parquet_path
+                     for parquet_path in sorted(glob.glob(os.path.join(args.trips, 'year=*', 'month=*', '*.parquet')))
+                     if args.force or not has_weather(parquet_path)]
+    print('{} files of the trip store to merge with {:,d} weather records'.format(len(parquet_files), len(df_weather)))
+
+    start = time.time()
+    total_rows = 0
+    for parquet_path in parquet_files:
+        rows, rows_without_weather = merge_weather_file(parquet_path, df_weather)
+        total_rows += rows
+        print('{}: {:,d} rows, {:,d} without weather'.format(
+            os.path.relpath(parquet_path, args.trips), rows, rows_without_weather))
+
+    elapsed = time.time() - start
+    print('{:,d} rows merged in {:.1f}s ({:,.0f} rows/s)'.format(total_rows, elapsed, total_rows / max(elapsed, 1e-9)))
+
+
+def ingest_summary(args):
+    # summary uses the rules defined here
+    import summary
+
+    start = time.time()
+    days = summary.build_summaries(args.trips, args.output)
+    print('{} days recomputed in {:.1f}s'.format(len(days), time.time() - start))
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description='Prepares the raw data for the DaVi-Dash-App.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    parser_tripdata = subparsers.add_parser(
+        'tripdata',
+        help='converts tripdata CSVs into the partitioned trip store'
+    )
+    parser_tripdata.add_argument('paths', nargs='+', help='CSV files or directories containing CSV files')
+    parser_tripdata.add_argument('--output', default=trips_path, help='root directory of the trip store')
+    parser_tripdata.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes')
+    parser_tripdata.add_argument('--chunksize', type=int, default=500000, help='CSV rows processed at once')
+    parser_tripdata.add_argument('--force', action='store_true', help='also convert already converted CSVs')
+    parser_tripdata.set_defaults(func=ingest_tripdata)
+
+    parser_weather = subparsers.add_parser(
+        'weather',
+        help='merges the hourly weather onto the trips of the trip store'
+    )
+    parser_weather.add_argument('weather', help='weather CSV (OpenWeather export) or parquet')
+    parser_weather.add_argument('--trips', default=trips_path, help='root directory of the trip store')
+    parser_weather.add_argument('--force', action='store_true', help='also merge files already having weather')
+    parser_weather.set_defaults(func=ingest_weather)
+
+    parser_summary = subparsers.add_parser(
+        'summary',
+        help='updates the daily summaries with the days of new or changed files of the trip store'
+    )
+    parser_summary.add_argument('--trips', default=trips_path, help='root directory of the trip store')
+    parser_summary.add_argument('--output', default=data_path, help='directory of the summaries')
+    parser_summary.set_defaults(func=ingest_summary)
+
+    return parser
+
+
+if __name__ == '__main__':
+    arguments = create_parser().parse_args()
+    arguments.func(arguments)
@@ -4,6 +4,8 @@ import dash_html_components as html
 import psutil
 from dash.dependencies import Output, Input, State
 
+import data
+
 '''
 For an example how tu use a Navbar with dash-bootstrap, see 
 https://dash-bootstrap-components.opensource.faculty.ai/docs/components/navbar/
@@ -16,6 +18,7 @@ items = dbc.Nav(
                 dbc.DropdownMenuItem('Version 1', href='trip-count'),
                 dbc.DropdownMenuItem('Version 2', href='trip-count-v2'),
                 dbc.DropdownMenuItem('Version 3', href='trip-count-v3'),
+                dbc.DropdownMenuItem('Fahrtströme', href='flows'),
             ],
             nav=True,
             in_navbar=True,
@@ -37,11 +40,13 @@ items = dbc.Nav(
 
 def get_sysinfo():
     info = psutil.virtual_memory()
+    datasets_memory = data.get_memory_usage()
 
     return [
         html.Small(
             '{:.3f}GB Memory Used ({}%)'.format(info[3] / (1024 ** 3), info[2]),
-            className='text-muted'
+            className='text-muted',
+            title='\n'.join('{}: {:.1f}MB'.format(name, size / (1024 ** 2)) for name, size in datasets_memory.items())
         ),
     ]
 
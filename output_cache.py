@@ -0,0 +1,63 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import plotly
+
+# upper bound for the serialized outputs kept by each cache
+output_cache_max_bytes = int(os.environ.get('DAVI_OUTPUT_CACHE_MB', 64)) * 1024 ** 2
+
+
+def normalize_selection(values):
+    """
+    :param values: The values of a multi-select dropdown, e.g. ['2', '1'].
+    :return: The values as sorted tuple, e.g. ('1', '2'), an empty tuple for None.
+    """
+    return tuple(sorted(values)) if values else ()
+
+
+class OutputCache:
+    """
+    Least recently used cache of callback outputs (figures, markdown), bounded by the size of the serialized outputs.
+    The keys have to contain the data version (see data.snapshot), the outputs of an old version are evicted
+    as they are no longer used.
+    """
+
+    def __init__(self, max_bytes=output_cache_max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, create):
+        """
+        :param key: The key of the outputs, e.g. the normalized inputs of the callback and the data version.
+        :param create: Function creating the outputs if they are not cached.
+        :return: The cached or created outputs, they must not be modified.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        outputs = create()
+        size = len(json.dumps(outputs, cls=plotly.utils.PlotlyJSONEncoder))
+
+        with self._lock:
+            if size <= self.max_bytes and key not in self._entries:
+                self._entries[key] = outputs
+                self._sizes[key] = size
+                self._size += size
+                while self._size > self.max_bytes:
+                    evicted_key, _ = self._entries.popitem(last=False)
+                    self._size -= self._sizes.pop(evicted_key)
+        return outputs
+
+    def get_size(self):
+        """
+        :return: The number of cached outputs and their serialized size in bytes.
+        """
+        with self._lock:
+            return len(self._entries), self._size
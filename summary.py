@@ -0,0 +1,244 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from data import create_filters, data_path, read_trips, trips_path
+from ingest import max_age, max_linear_distance, max_trip_duration, tripdata_timezone
+
+summary_file = 'summary-daily-subscribers_only-citibike-tripweather.parquet'
+summary_gender_file = 'summary-daily-subscribers_only-gender_grouped-citibike-tripweather.parquet'
+# partial aggregates per file of the trip store, day and gender, merged into the summaries
+partials_file = 'summary-partials-subscribers_only-citibike-tripweather.parquet'
+
+trip_measures = ['Trip Duration', 'Linear Distance', 'Age 2020']
+weather_measures = ['temp', 'humidity', 'wind_speed']
+weather_sums = ['rain_1h', 'snow_1h']
+# columns of a new summary written as integers
+count_columns = ['Trip count', 'Age 2020 count']
+
+
+def get_summary_columns():
+    columns = ['Trip count']
+    for measure in trip_measures:
+        statistics = ['count', 'mean', 'std', 'min', 'median', 'max'] if measure == 'Age 2020' else \
+            ['mean', 'std', 'min', 'median', 'max']
+        columns.extend('{} {}'.format(measure, statistic) for statistic in statistics)
+    for measure in weather_measures:
+        columns.extend('{} {}'.format(measure, statistic) for statistic in ['mean', 'std', 'median', 'min', 'max'])
+    for measure in weather_sums:
+        columns.extend('{} {}'.format(measure, statistic) for statistic in ['sum', 'min', 'max'])
+    return columns
+
+
+def read_subscriber_trips(path, columns, start=None, end=None):
+    df = read_trips(
+        columns=['Start Time', 'User Type', 'Gender'] + columns,
+        filters=create_filters(user_types=['Subscriber'], start=start, end=end),
+        path=path
+    )
+    # unrealistic trips are not part of the summaries (trip stores written by ingest.py do not contain them)
+    df = df[(df['Trip Duration'] <= max_trip_duration)
+            & (df['Linear Distance'] <= max_linear_distance)
+            & ~(df['Age 2020'] > max_age).fillna(False).astype(bool)]
+    return df.assign(
+        Date=df['Start Time'].dt.tz_localize(None).dt.normalize(),
+        Gender=df['Gender'].astype(str)
+    )
+
+
+def create_partials(path):
+    """
+    Computes the mergeable partial aggregates (count, mean, sum of squared deviations, min and max) of the trip
+    measures per day and gender of one file of the trip store.
+    :param path: The file of the trip store.
+    :return: The partial aggregates.
+    """
+    df = read_subscriber_trips(path, trip_measures)
+    grouped = df.groupby(['Date', 'Gender'])
+
+    df_partials = pd.DataFrame({'Trip count': grouped.size()})
+    for measure in trip_measures:
+        values = df[measure].astype(np.float64)
+        grouped_values = values.groupby([df['Date'], df['Gender']])
+        df_partials['{} n'.format(measure)] = grouped_values.count()
+        df_partials['{} mean'.format(measure)] = grouped_values.mean()
+        df_partials['{} m2'.format(measure)] = grouped_values.var(ddof=0) * grouped_values.count()
+        df_partials['{} min'.format(measure)] = grouped_values.min()
+        df_partials['{} max'.format(measure)] = grouped_values.max()
+
+    return df_partials.reset_index()
+
+
+def merge_partials(df_partials, by):
+    """
+    Merges partial aggregates (see create_partials) with the parallel algorithm of Chan et al., so count, mean and
+    standard deviation do not need the trips.
+    :param df_partials: The partial aggregates.
+    :param by: The columns to group by.
+    :return: Trip count and count, mean, std, min, max of each trip measure.
+    """
+    keys = [df_partials[col] for col in by]
+    df_merged = pd.DataFrame({'Trip count': df_partials['Trip count'].groupby(keys).sum()})
+    for measure in trip_measures:
+        n = df_partials['{} n'.format(measure)]
+        mean = df_partials['{} mean'.format(measure)].fillna(0.0)
+        n_total = n.groupby(keys).transform('sum')
+        mean_total = (n * mean).groupby(keys).transform('sum') / n_total
+        m2_total = (df_partials['{} m2'.format(measure)].fillna(0.0) + n * (mean - mean_total) ** 2).groupby(keys).sum()
+
+        count = n.groupby(keys).sum()
+        df_merged['{} count'.format(measure)] = count
+        df_merged['{} mean'.format(measure)] = mean_total.groupby(keys).first()
+        df_merged['{} std'.format(measure)] = np.sqrt(m2_total / (count - 1)).where(count > 1)
+        df_merged['{} min'.format(measure)] = df_partials['{} min'.format(measure)].groupby(keys).min()
+        df_merged['{} max'.format(measure)] = df_partials['{} max'.format(measure)].groupby(keys).max()
+    return df_merged
+
+
+def get_day_statistics(path, days):
+    """
+    Computes the statistics which are not mergeable (medians, weather per hour) for the given days only.
+    :param path: The partition of the trip store containing the days.
+    :param days: The days to compute.
+    :return: Medians per day and per day and gender, weather statistics per day.
+    """
+    start = pd.Timestamp(min(days)).tz_localize(tripdata_timezone)
+    end = (pd.Timestamp(max(days)) + pd.Timedelta(days=1)).tz_localize(tripdata_timezone)
+    df = read_subscriber_trips(path, trip_measures + ['dt_utc'] + weather_measures + weather_sums, start, end)
+    df = df[df['Date'].isin(days)]
+
+    df_medians = df.groupby('Date')[trip_measures].median()
+    df_medians_gender = df.groupby(['Date', 'Gender'])[trip_measures].median()
+
+    # the weather is measured hourly, each hour is only counted once
+    df_weather = df.assign(hour=df['dt_utc'].dt.round('h')).drop_duplicates(subset=['Date', 'hour'])
+    grouped_weather = df_weather.groupby('Date')
+    df_weather_stats = pd.concat(
+        [grouped_weather[weather_measures].agg(['mean', 'std', 'median', 'min', 'max']),
+         grouped_weather[weather_sums].agg(['sum', 'min', 'max'])],
+        axis=1
+    )
+    df_weather_stats.columns = ['{} {}'.format(measure, statistic) for measure, statistic in df_weather_stats.columns]
+
+    return df_medians, df_medians_gender, df_weather_stats
+
+
+def _get_source_files(trips_root):
+    return {
+        os.path.relpath(path, trips_root): os.path.getmtime(path)
+        for path in sorted(glob.glob(os.path.join(trips_root, 'year=*', 'month=*', '*.parquet')))
+    }
+
+
+def get_summary_dtypes(df, df_existing=None):
+    """
+    :param df: The summary to write.
+    :param df_existing: The summary written so far, None if there is none.
+    :return: The dtype of each column: the dtype of the existing summary, so an incremental rebuild keeps the schema
+    of the file. For a new summary (or a new column) int64 for the counts and float64 for the other statistics.
+    """
+    dtypes = {}
+    for column in df.columns:
+        if df_existing is not None and column in df_existing.columns:
+            dtype = df_existing[column].dtype
+            # missing values cannot be written as integers
+            dtypes[column] = dtype if not (pd.api.types.is_integer_dtype(dtype) and df[column].isna().any()) \
+                else np.float64
+        elif column in count_columns:
+            dtypes[column] = np.int64
+        else:
+            dtypes[column] = np.float64
+    return dtypes
+
+
+def _read_summary(path):
+    if not os.path.exists(path):
+        return None
+    df = pd.read_parquet(path)
+    if 'Gender' in df.columns:
+        df = df.assign(Gender=df['Gender'].astype(str)).set_index('Gender', append=True)
+    return df
+
+
+def _write(df, path):
+    tmp_path = path + '.tmp'
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def build_summaries(trips_root=trips_path, output_path=data_path):
+    """
+    Updates the daily summaries from the trip store. Partial aggregates are only computed for new or changed files of
+    the trip store and only the days contained in those files are recomputed.
+    :param trips_root: The root directory of the trip store.
+    :param output_path: The directory of the summaries.
+    :return: The recomputed days.
+    """
+    sources = _get_source_files(trips_root)
+    partials_path = os.path.join(output_path, partials_file)
+    df_partials = pd.read_parquet(partials_path) if os.path.exists(partials_path) else None
+
+    if df_partials is not None:
+        unchanged = df_partials['source_mtime'] == df_partials['source'].map(sources)
+        affected_days = set(df_partials.loc[~unchanged, 'Date'])
+        df_partials = df_partials[unchanged]
+        known_sources = set(df_partials['source'])
+    else:
+        affected_days = set()
+        known_sources = set()
+
+    new_partials = []
+    for source, mtime in sources.items():
+        if source not in known_sources:
+            df_source_partials = create_partials(os.path.join(trips_root, source)).assign(source=source,
+                                                                                         source_mtime=mtime)
+            affected_days.update(df_source_partials['Date'])
+            new_partials.append(df_source_partials)
+
+    if len(affected_days) == 0:
+        return []
+
+    df_partials = pd.concat(([df_partials] if df_partials is not None else []) + new_partials, ignore_index=True)
+    df_affected = df_partials[df_partials['Date'].isin(affected_days)]
+
+    df_summary = merge_partials(df_affected, ['Date'])
+    df_summary_gender = merge_partials(df_affected, ['Date', 'Gender'])
+
+    # medians and weather are recomputed from the trips of the affected days only
+    medians, medians_gender, weather_stats = [], [], []
+    partitions = df_affected['source'].map(os.path.dirname)
+    for partition, partition_days in df_affected.groupby(partitions)['Date']:
+        day_statistics = get_day_statistics(os.path.join(trips_root, partition), sorted(set(partition_days)))
+        medians.append(day_statistics[0])
+        medians_gender.append(day_statistics[1])
+        weather_stats.append(day_statistics[2])
+
+    for df_target, df_medians in ((df_summary, pd.concat(medians)), (df_summary_gender, pd.concat(medians_gender))):
+        for measure in trip_measures:
+            df_target['{} median'.format(measure)] = df_medians[measure]
+    df_weather_stats = pd.concat(weather_stats)
+    df_summary = df_summary.join(df_weather_stats)
+    df_summary_gender = df_summary_gender.join(df_weather_stats, on='Date')
+
+    columns = get_summary_columns()
+    df_summary = df_summary.reindex(columns=columns)
+    df_summary_gender = df_summary_gender.reindex(columns=columns)
+
+    # replace the affected days in the existing summaries
+    for df_new, file in ((df_summary, summary_file), (df_summary_gender, summary_gender_file)):
+        path = os.path.join(output_path, file)
+        df_existing = _read_summary(path)
+        if df_existing is not None:
+            days = df_existing.index.get_level_values('Date')
+            df_new = pd.concat([df_existing[~days.isin(affected_days)], df_new])
+        df_new = df_new.astype(get_summary_dtypes(df_new, df_existing)).sort_index()
+        if 'Gender' in df_new.index.names:
+            df_new = df_new.reset_index(level='Gender')
+            df_new.insert(0, 'Gender', df_new.pop('Gender').astype('category'))
+        _write(df_new, path)
+
+    _write(df_partials, partials_path)
+
+    return sorted(affected_days)
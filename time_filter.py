@@ -0,0 +1,104 @@
+import dash_core_components as dcc
+import dash_html_components as html
+from dash.dependencies import Output, Input
+
+from aggregation import get_time_index
+
+'''
+Filters by date, hour of day and weekday for the pages "Nutzung Stationen". The selected time window is answered from
+the sorted Start Time index of the month (see aggregation.TimeIndex).
+'''
+
+weekday_names = ['Montag', 'Dienstag', 'Mittwoch', 'Donnerstag', 'Freitag', 'Samstag', 'Sonntag']
+
+
+def get_day_slider_properties(month=None):
+    """
+    :param month: The month (YYYY-MM), defaults to the latest available month.
+    :return: The maximum, the marks and the value (all days) of the date range slider, the values are the days since
+    the first day of the month's trips.
+    """
+    time_index = get_time_index(month)
+    last_day = max(time_index.day_count - 1, 0)
+    marks = {
+        day: time_index.get_day(day).strftime('%d.%m.')
+        for day in range(0, last_day + 1, 7)
+    } if time_index.first_day is not None else {}
+    return last_day, marks, [0, last_day]
+
+
+def get_time_window(month, day_values, hour_values, weekday_values):
+    """
+    Converts the values of the filters to a time window, the same selection always gives the same time window.
+    :param month: The month (YYYY-MM), None for the latest available month.
+    :param day_values: The first and the last day of the date range slider.
+    :param hour_values: The first hour and the hour after the last hour of the hour slider.
+    :param weekday_values: The selected weekdays (0 = Monday).
+    :return: The time window as (start, end, hours, weekdays), see aggregation.TimeIndex.get_rows, None for all trips.
+    """
+    time_index = get_time_index(month)
+    start = end = None
+    if day_values is not None and time_index.first_day is not None:
+        # the values of the slider may be from another month while the month is changed
+        first_day, last_day = (min(max(int(value), 0), time_index.day_count - 1) for value in day_values)
+        if first_day > 0:
+            start = time_index.get_day(first_day)
+        if last_day < time_index.day_count - 1:
+            end = time_index.get_day(last_day + 1)
+    hours = ()
+    if hour_values is not None and (hour_values[0] > 0 or hour_values[1] < 24):
+        hours = tuple(range(int(hour_values[0]), int(hour_values[1])))
+    weekdays = tuple(sorted(set(weekday_values))) if weekday_values is not None else ()
+
+    if start is None and end is None and len(hours) == 0 and len(weekdays) == 0:
+        return None
+    return start, end, hours, weekdays
+
+
+def create_time_filter(prefix, month=None):
+    """
+    :param prefix: The prefix of the page's IDs.
+    :param month: The month (YYYY-MM) of the date range slider, defaults to the latest available month.
+    :return: The components of the filters, to be added to the card "Filterauswahl".
+    """
+    last_day, marks, value = get_day_slider_properties(month)
+    return [
+        html.H5('Zeitraum', className='card-title'),
+        dcc.RangeSlider(
+            id='{}-slider-days'.format(prefix),
+            min=0, max=last_day, step=1, value=value,
+            marks=marks,
+            allowCross=False,
+            updatemode='mouseup',
+            className='mb-3'
+        ),
+        html.H5('Uhrzeit', className='card-title'),
+        dcc.RangeSlider(
+            id='{}-slider-hours'.format(prefix),
+            min=0, max=24, step=1, value=[0, 24],
+            marks={hour: '{}:00'.format(hour) for hour in range(0, 25, 6)},
+            allowCross=False,
+            # at least one hour, the same value for both handles would be an empty window
+            pushable=1,
+            updatemode='mouseup',
+            className='mb-3'
+        ),
+        html.H5('Wochentag', className='card-title'),
+        dcc.Dropdown(
+            id='{}-dropdown-weekday'.format(prefix),
+            options=[dict(label=name, value=weekday) for weekday, name in enumerate(weekday_names)],
+            multi=True,
+            className='mb-3'
+        ),
+    ]
+
+
+def register_callbacks(app, prefix):
+    @app.callback(
+        [Output('{}-slider-days'.format(prefix), 'max'),
+         Output('{}-slider-days'.format(prefix), 'marks'),
+         Output('{}-slider-days'.format(prefix), 'value')],
+        [Input('{}-dropdown-month'.format(prefix), 'value')]
+    )
+    def callback_month_days(month_value):
+        return get_day_slider_properties(month_value)
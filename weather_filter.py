@@ -0,0 +1,88 @@
+import dash_core_components as dcc
+import dash_html_components as html
+
+from aggregation import temperature_bin_width, wind_speed_bin_width
+
+'''
+Filters by the weather of the trips' start hour for the pages "Nutzung Stationen". The selected weather is answered
+from the station × weather condition counts of the month (see aggregation.WeatherCube).
+'''
+
+weather_main_labels = {
+    'Clear': 'Klar',
+    'Clouds': 'Bewölkt',
+    'Drizzle': 'Nieselregen',
+    'Rain': 'Regen',
+    'Thunderstorm': 'Gewitter',
+    'Snow': 'Schnee',
+    'Mist': 'Dunst',
+    'Haze': 'Dunst (trocken)',
+    'Fog': 'Nebel',
+}
+
+# range of the sliders, the ends of the sliders include all lower or higher values
+temperature_range = (-20, 40)
+wind_speed_range = (0, 20)
+
+
+def _get_range(values, limits):
+    # None for an end of the slider, None if both ends are selected
+    if values is None:
+        return None
+    low = values[0] if values[0] > limits[0] else None
+    high = values[1] if values[1] < limits[1] else None
+    return (low, high) if low is not None or high is not None else None
+
+
+def get_weather(weather_main_values, temperature_values, wind_speed_values):
+    """
+    Converts the values of the filters to a weather selection, the same selection always gives the same weather.
+    :param weather_main_values: The selected weather_main values.
+    :param temperature_values: The lowest and highest temperature of the temperature slider.
+    :param wind_speed_values: The lowest and highest wind speed of the wind speed slider.
+    :return: The weather as (weather mains, temperatures, wind speeds), see aggregation.WeatherCube.get_conditions, None
+    for all trips.
+    """
+    weather_mains = tuple(sorted(set(weather_main_values))) if weather_main_values is not None else ()
+    temperatures = _get_range(temperature_values, temperature_range)
+    wind_speeds = _get_range(wind_speed_values, wind_speed_range)
+    if len(weather_mains) == 0 and temperatures is None and wind_speeds is None:
+        return None
+    return weather_mains, temperatures, wind_speeds
+
+
+def create_weather_filter(prefix):
+    """
+    :param prefix: The prefix of the page's IDs.
+    :return: The components of the filters, to be added to the card "Filterauswahl".
+    """
+    return [
+        html.H5('Wetter', className='card-title'),
+        dcc.Dropdown(
+            id='{}-dropdown-weather'.format(prefix),
+            options=[dict(label=label, value=value) for value, label in weather_main_labels.items()],
+            multi=True,
+            className='mb-3'
+        ),
+        html.H5('Temperatur', className='card-title'),
+        dcc.RangeSlider(
+            id='{}-slider-temperature'.format(prefix),
+            min=temperature_range[0], max=temperature_range[1], step=temperature_bin_width,
+            value=list(temperature_range),
+            marks={value: '{} °C'.format(value)
+                   for value in range(temperature_range[0], temperature_range[1] + 1, 10)},
+            allowCross=False,
+            updatemode='mouseup',
+            className='mb-3'
+        ),
+        html.H5('Wind', className='card-title'),
+        dcc.RangeSlider(
+            id='{}-slider-wind-speed'.format(prefix),
+            min=wind_speed_range[0], max=wind_speed_range[1], step=wind_speed_bin_width,
+            value=list(wind_speed_range),
+            marks={value: '{} m/s'.format(value)
+                   for value in range(wind_speed_range[0], wind_speed_range[1] + 1, 4)},
+            allowCross=False,
+            updatemode='mouseup'
+        ),
+    ]